@@ -0,0 +1,272 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+"""
+Benchmarks for the genetic programming code. Results are written as
+JSON, and compared against a baseline if one is given
+"""
+
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+
+import numpy
+
+import regression
+import epro.gp.core
+import epro.gp.selection
+import epro.gp.tree
+import epro.gp.util
+import epro.gp.operator as gpop
+
+DATA_SETS = ['data/TrainingSet.csv', 'data/TrainingSet2.csv',
+             'data/TrainingSet3.csv']
+SYNTHETIC_SIZES = [10 ** 4, 10 ** 5, 10 ** 6]
+TERMINAL_SET = ['x', 'y', 'z']
+INTERNAL_SET = [('add', 2), ('sub', 2), ('mul', 2), ('div', 2),
+                ('pow', 2), ('sqrt',1), ('abs', 1), ('log', 1),
+                ('log10', 1), ('sin', 1), ('cos', 1), ('tan', 1),
+                ('max', 2), ('min', 2)]
+SEED = 2010
+
+# Slowdown tolerated before a result counts as a regression
+TOLERANCE = 0.2
+
+"""
+Data set with random records. The target is a fixed function of the
+three variables plus noise
+"""
+class SyntheticDataSet:
+    def __init__(self, size, seed=SEED):
+        state = numpy.random.RandomState(seed)
+        self.names = ['a', 'b', 'c', 't']
+        self.data = numpy.empty((size, 4), order='F')
+        self.data[:, :3] = state.uniform(0.0, 1.0, (size, 3))
+        x, y, z = self.data[:, 0], self.data[:, 1], self.data[:, 2]
+        self.data[:, 3] = x * x + numpy.sin(y) * z + \
+            state.normal(0.0, 0.01, size)
+
+def parameters():
+    return epro.gp.tree.TreeInitParameters(TERMINAL_SET, INTERNAL_SET, 0.05)
+
+def randomTrees(count, height, p_full=0.5):
+    random.seed(SEED)
+    tree_parameters = parameters()
+    return [epro.gp.tree.Tree(tree_parameters, max(8, height), height,
+                              p_full)
+            for i in range(count)]
+
+"""
+Returns the shortest of the wall clock times taken by func. As in
+timeit, garbage collection is disabled while timing
+"""
+def bestTime(func, repeat=5):
+    times = []
+    enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        for i in range(repeat):
+            start = time.time()
+            func()
+            times.append(time.time() - start)
+    finally:
+        if enabled:
+            gc.enable()
+
+    return min(times)
+
+def result(value, unit):
+    return {'value': value, 'unit': unit}
+
+# Node evaluations (nodes times records) per second of the fitness
+# function, without caches
+def benchmarkEvaluation(data_set, trees):
+    evaluator = regression.array_evaluator(data_set, TERMINAL_SET)
+    nodes = sum([len(tree) for tree in trees]) * len(data_set.data)
+
+    def run():
+        for tree in trees:
+            regression.fitness_function(tree, evaluator)
+
+    return result(nodes / bestTime(run), 'nodes/s')
+
+# Offspring per second of a genetic operator
+def benchmarkOperator(operator, trees):
+    def run():
+        random.seed(SEED)
+        for i in range(len(trees)):
+            operator.apply(*[trees[(i + j) % len(trees)]
+                             for j in range(operator.arity)])
+
+    return result(len(trees) * operator.arity / bestTime(run), 'offspring/s')
+
+# Microseconds taken by randomNode, with and without limits
+def benchmarkRandomNode(trees, max_depth, max_height, passes=20):
+    def run():
+        random.seed(SEED)
+        for i in range(passes):
+            for tree in trees:
+                tree.randomNode(max_depth, max_height)
+
+    return result(1e6 * bestTime(run) / (passes * len(trees)), 'us')
+
+# Parents per second of a selection scheme, for a whole generation
+def benchmarkSelection(selection, population_size):
+    individuals = range(population_size)
+
+    def run():
+        random.seed(SEED)
+        parents = epro.gp.selection.Parents(individuals, selection)
+        for i in xrange(population_size):
+            parents.next()
+
+    return result(population_size / bestTime(run), 'parents/s')
+
+# Generations per second of a whole evolution
+def benchmarkEvolution(data_set, population_size, generations):
+    def run():
+        random.seed(SEED)
+        population = epro.gp.core.GPPopulation(population_size,
+                                               parameters(), 8, 2)
+        operator_set = gpop.GeneticOperatorSet(
+            [gpop.GeneticReproduction(), gpop.GeneticMutation(),
+             gpop.GeneticCrossover()], [20, 35, 45])
+        evaluator = epro.gp.core.GPEvaluator(
+            regression.fitness_function,
+            regression.array_evaluator(data_set, TERMINAL_SET),
+            regression.array_evaluator(data_set, TERMINAL_SET))
+        epro.gp.core.evolution(population, operator_set, evaluator,
+                               generations, verbose=False)
+
+    return result(generations / bestTime(run, 3), 'generations/s')
+
+def runBenchmarks(synthetic_sizes, population_size, generations):
+    results = {}
+    data_sets = [(name, epro.gp.util.CSVDataSet(name)) for name in DATA_SETS]
+    data_sets += [('synthetic-%d' % size, SyntheticDataSet(size))
+                  for size in synthetic_sizes]
+
+    trees = randomTrees(100, 6)
+    for name, data_set in data_sets:
+        # Fewer trees for the largest data sets
+        count = max(5, min(100, 10 ** 7 // len(data_set.data)))
+        results['evaluation/' + name] = \
+            benchmarkEvaluation(data_set, trees[:count])
+
+    operands = randomTrees(1000, 6)
+    results['operator/crossover'] = \
+        benchmarkOperator(gpop.GeneticCrossover(), operands)
+    results['operator/mutation'] = \
+        benchmarkOperator(gpop.GeneticMutation(), operands)
+
+    for name, selection in [
+            ('greedy', epro.gp.selection.GreedyOverselection()),
+            ('tournament', epro.gp.selection.TournamentSelection()),
+            ('rank', epro.gp.selection.RankSelection())]:
+        results['selection/' + name] = benchmarkSelection(selection, 50000)
+
+    for height in [4, 6, 8, 10, 12]:
+        trees = randomTrees(200, height, 1.0)
+        results['randomNode/height-%d' % height] = \
+            benchmarkRandomNode(trees, 30, 30)
+        results['randomNode/height-%d/limited' % height] = \
+            benchmarkRandomNode(trees, height // 2, height // 2)
+
+    for name, data_set in data_sets:
+        # Shorter runs for the largest data sets
+        size = population_size if len(data_set.data) <= 10 ** 4 \
+            else max(10, population_size // 10)
+        results['evolution/' + name] = \
+            benchmarkEvolution(data_set, size, generations)
+
+    return results
+
+# Microseconds are better when lower, everything else when higher
+def slowdown(value, baseline, unit):
+    if unit == 'us':
+        return value / baseline - 1.0
+    return baseline / value - 1.0
+
+"""
+Prints how each result compares to the baseline. Returns the names
+of the results that got slower than the tolerance allows
+"""
+def compare(results, baseline, tolerance=TOLERANCE):
+    regressions = []
+
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+
+        value = results[name]['value']
+        reference = baseline[name]['value']
+        change = slowdown(value, reference, results[name]['unit'])
+        flag = ''
+
+        if change > tolerance:
+            regressions.append(name)
+            flag = ' REGRESSION'
+
+        print "%-45s %12.4g %12.4g %+7.1f%%%s" % \
+            (name, reference, value, 100 * change, flag)
+
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('output', help='JSON file for the results')
+    parser.add_argument('--baseline', help='JSON file to compare against')
+    parser.add_argument('--sizes', type=int, nargs='*',
+                        default=SYNTHETIC_SIZES,
+                        help='records of the synthetic data sets')
+    parser.add_argument('--population', type=int, default=100)
+    parser.add_argument('--generations', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    arguments = parser.parse_args()
+
+    results = runBenchmarks(arguments.sizes, arguments.population,
+                            arguments.generations)
+
+    report = {'python': platform.python_version(),
+              'numpy': numpy.__version__,
+              'machine': platform.machine(),
+              'results': results}
+
+    with open(arguments.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as f:
+            baseline = json.load(f)['results']
+
+        regressions = compare(results, baseline, arguments.tolerance)
+        if regressions:
+            print "%d regressions" % len(regressions)
+            sys.exit(1)
+    else:
+        for name in sorted(results):
+            print "%-45s %12.4g %s" % (name, results[name]['value'],
+                                       results[name]['unit'])
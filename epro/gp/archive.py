@@ -0,0 +1,118 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+import bisect
+import math
+
+import epro.gp.core
+
+# Default parameter values
+CAPACITY = 50
+
+"""
+Archive of the individuals not dominated in training error and
+number of nodes: no other individual seen is as accurate and as
+small while being better in one of them. Individuals are kept by
+increasing size, and so by decreasing error. Their fitness is used
+as is, so they are never evaluated again. Individuals without an
+exact finite fitness are ignored, and so are repeated ones, which
+are dominated by themselves. When the archive holds more than
+capacity individuals, the one in the most crowded region of the
+front is dropped, but never the smallest or the most accurate ones
+"""
+class ParetoArchive:
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.sizes = []
+        self.errors = []
+        self.individuals = []
+
+    def __len__(self):
+        return len(self.individuals)
+
+    """
+    Adds the individual unless it is dominated. Returns whether it was
+    added
+    """
+    def add(self, individual):
+        error = individual.fitness
+        if error is None or isinstance(error, epro.gp.core.FitnessBound) \
+                or math.isinf(error) or math.isnan(error):
+            return False
+
+        size = len(individual)
+        # Entries before position are not larger than the individual,
+        # and the last of them is the most accurate
+        position = bisect.bisect_right(self.sizes, size)
+        if position and self.errors[position - 1] <= error:
+            return False
+
+        # Entries it dominates are the one of the same size, if any, and
+        # the larger ones that are not more accurate
+        start = bisect.bisect_left(self.sizes, size)
+        end = position
+        while end < len(self.sizes) and self.errors[end] >= error:
+            end += 1
+
+        self.sizes[start:end] = [size]
+        self.errors[start:end] = [error]
+        self.individuals[start:end] = [individual]
+
+        if len(self.individuals) > self.capacity:
+            self.drop(self.mostCrowded())
+
+        return True
+
+    def addAll(self, individuals):
+        for individual in individuals:
+            self.add(individual)
+
+    """
+    Returns the most accurate individual, or None if the archive is
+    empty
+    """
+    def best(self):
+        return self.individuals[-1] if self.individuals else None
+
+    """
+    Returns the (error, size, individual) entries, smallest first
+    """
+    def front(self):
+        return zip(self.errors, self.sizes, self.individuals)
+
+    # Position of the inner entry closest to its neighbours, with sizes
+    # and errors relative to their ranges in the archive. Without inner
+    # entries, the smallest one
+    def mostCrowded(self):
+        if len(self.individuals) < 3:
+            return 0
+
+        size_range = float(self.sizes[-1] - self.sizes[0]) or 1.0
+        error_range = (self.errors[0] - self.errors[-1]) or 1.0
+
+        return min(range(1, len(self.individuals) - 1), key = lambda i:
+                   (self.sizes[i + 1] - self.sizes[i - 1]) / size_range +
+                   (self.errors[i - 1] - self.errors[i + 1]) / error_range)
+
+    def drop(self, position):
+        del self.sizes[position]
+        del self.errors[position]
+        del self.individuals[position]
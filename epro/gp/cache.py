@@ -0,0 +1,121 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+import collections
+
+"""
+Bounded map. When full, the least recently used entry is evicted.
+Hits and misses are counted
+"""
+class LRUCache:
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    """
+    Returns the value stored for key, None if there is none
+    """
+    def get(self, key):
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+
+        # Reinserting marks the entry as the most recently used
+        self.entries[key] = value
+        self.hits += 1
+
+        return value
+
+    def put(self, key, value):
+        self.entries.pop(key, None)
+
+        if len(self.entries) >= self.capacity:
+            self.entries.popitem(last=False)
+
+        self.entries[key] = value
+
+    def hitRate(self):
+        lookups = self.hits + self.misses
+
+        return float(self.hits) / lookups if lookups else 0.0
+
+"""
+Bounded map from canonical tree hashes to fitness values
+"""
+class FitnessCache(LRUCache):
+    pass
+
+"""
+Bounded map from subtrees to their outputs over a data set. The
+budget is given in bytes of cached output, and the least recently
+used outputs are evicted first. Stored outputs are read only copies
+"""
+class OutputCache:
+    def __init__(self, budget=64 * 2 ** 20, min_size=4):
+        self.budget = budget     # Bytes available for outputs
+        self.min_size = min_size # Smaller subtrees are not cached
+        self.used = 0
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    """
+    Returns the output stored for key, None if there is none
+    """
+    def get(self, key):
+        try:
+            output = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self.entries[key] = output
+        self.hits += 1
+
+        return output
+
+    def put(self, key, output):
+        if output.nbytes > self.budget or key in self.entries:
+            return
+
+        while self.used + output.nbytes > self.budget:
+            evicted = self.entries.popitem(last=False)[1]
+            self.used -= evicted.nbytes
+
+        output = output.copy()
+        output.setflags(write=False)
+        self.entries[key] = output
+        self.used += output.nbytes
+
+    def hitRate(self):
+        lookups = self.hits + self.misses
+
+        return float(self.hits) / lookups if lookups else 0.0
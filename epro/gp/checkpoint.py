@@ -0,0 +1,82 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+import cPickle
+import os
+import random
+
+import epro.gp.archive
+import epro.gp.serialize
+
+"""
+Writes the state of a run at the beginning of a generation: the
+population, the epro.gp.archive.ParetoArchive of the run, the
+generation number, the racing threshold and the state of the random module.
+The file is written under a temporary name and renamed, so a
+checkpoint is never left half written
+"""
+def save(filename, population, evaluator, archive, generation):
+    parameters = population.tree_parameters
+    state = {'generation': generation,
+             'random': random.getstate(),
+             'threshold': evaluator.threshold,
+             'symbols': parameters.symbols,
+             'population': epro.gp.serialize.encodeTrees(
+                 population.individuals, parameters),
+             'archive': epro.gp.serialize.encodeTrees(archive.individuals,
+                                                      parameters),
+             'archive_capacity': archive.capacity}
+
+    temporary = filename + '.tmp'
+
+    with open(temporary, 'wb') as f:
+        cPickle.dump(state, f, cPickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.rename(temporary, filename)
+
+"""
+Restores a checkpoint into population and evaluator, and the state
+of the random module. Returns the generation to continue from and
+the archive of the run. Continuing with the same
+settings gives the same results as the uninterrupted run, except
+when racing, since bounds in the fitness cache are lost
+"""
+def load(filename, population, evaluator):
+    with open(filename, 'rb') as f:
+        state = cPickle.load(f)
+
+    parameters = population.tree_parameters
+    if state['symbols'] != parameters.symbols:
+        raise ValueError("Checkpoint %s was made with other symbols" %
+                         filename)
+
+    population.individuals = epro.gp.serialize.decodeTrees(
+        state['population'], parameters)
+    evaluator.threshold = state['threshold']
+    random.setstate(state['random'])
+
+    archive = epro.gp.archive.ParetoArchive(state['archive_capacity'])
+    archive.addAll(epro.gp.serialize.decodeTrees(state['archive'],
+                                                 parameters))
+
+    return state['generation'], archive
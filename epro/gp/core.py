@@ -19,11 +19,21 @@
 #
 #========================================================================
 
+import heapq
+import multiprocessing
+import Queue
 import random
 
+import numpy
+
+import epro.gp.archive
+import epro.gp.checkpoint
+import epro.gp.instrument
 import epro.gp.tree
 import epro.gp.operator
 import epro.gp.protected
+import epro.gp.selection
+import epro.gp.serialize
 
 # Default parameter values
 MAX_DEPTH = 30
@@ -31,14 +41,26 @@ INIT_DEPTH = 3
 P_GROW = 1.0
 POPULATION_SIZE=500
 CROSSOVER_RATE=0.95
+CHECKPOINT_INTERVAL=10
+TOURNAMENT_SIZE=2
+BUDGET_ATTEMPTS=10
 
+"""
+Population of trees. Its size may be zero for populations that are
+restored from a checkpoint. A node budget, if given, is a soft limit
+on the total number of nodes of each generation. Breeding rejects
+offspring that would exceed it, but after BUDGET_ATTEMPTS rejections
+keeps the smallest one, so a generation may go slightly over
+"""
 class GPPopulation:
     def __init__(self, size, tree_parameters,
                  max_depth=MAX_DEPTH,
                  init_depth=INIT_DEPTH,
-                 p_grow=P_GROW):
+                 p_grow=P_GROW,
+                 node_budget=None):
         self.individuals = []
         self.tree_parameters = tree_parameters
+        self.node_budget = node_budget
         self.halfAndHalfInit(size, max_depth, init_depth, p_grow)
 
     def halfAndHalfInit(self, size, max_depth,
@@ -65,83 +87,617 @@ class GPSettings:
         self.crossover_rate = crossover_rate
         self.max_generations = max_generations
 
+"""
+Lower bound of the fitness of an individual whose evaluation was
+aborted, because its error had already exceeded the threshold
+"""
+class FitnessBound(float):
+    pass
+
+# Individuals are ranked by fitness. Those with a bound exceeded the
+# threshold, so they go after the ones with an exact fitness
+def rankKey(individual):
+    return (isinstance(individual.fitness, FitnessBound), individual.fitness)
+
+# When racing the fitness function also gets the threshold above
+# which evaluation may be aborted
+def computeFitness(func, individual, training_args, threshold):
+    if threshold is None:
+        return func(individual, training_args)
+
+    return func(individual, training_args, threshold)
+
+# A batch fitness function evaluates a list of individuals at once
+# and returns their fitness values in the same order. Otherwise the
+# fitness function is called for each of them
+def computeBatchFitness(func, batch_func, individuals, training_args,
+                        threshold):
+    if batch_func is None:
+        return [computeFitness(func, individual, training_args, threshold)
+                for individual in individuals]
+
+    if threshold is None:
+        return batch_func(individuals, training_args)
+
+    return batch_func(individuals, training_args, threshold)
+
+# Fitness functions and training arguments of a worker process. They
+# are set when the worker is forked, so the data set is never sent
+# along with the individuals
+worker_state = None
+
+def initWorker(func, batch_func, training_args):
+    global worker_state
+    worker_state = (func, batch_func, training_args)
+
+# Individuals are sent to workers encoded by epro.gp.serialize
+def batchTask(threshold, individuals):
+    parameters = individuals[0].parameters
+    return (threshold, parameters,
+            epro.gp.serialize.encodeTrees(individuals, parameters))
+
+def evaluateBatch(task):
+    func, batch_func, training_args = worker_state
+    threshold, parameters, encoded = task
+    individuals = epro.gp.serialize.decodeTrees(encoded, parameters)
+    return computeBatchFitness(func, batch_func, individuals,
+                               training_args, threshold)
+
 class GPEvaluator:
     
-    def __init__(self, func, training_args, testing_args):
+    def __init__(self, func, training_args, testing_args, cache=None,
+                 workers=1, batch_size=None, racing=None, batch_func=None,
+                 monitor=None, selection=None, parsimony=None):
         self.func = func
+        # Optional function evaluating many individuals at once, such
+        # as a streaming evaluation visiting each record once
+        self.batch_func = batch_func
         self.training_args = training_args
         self.testing_args = testing_args
+        # Optional epro.gp.cache.FitnessCache. Individuals already
+        # seen, such as the ones copied by reproduction, are not
+        # evaluated again
+        self.cache = cache
+        # With more than one worker populations are evaluated by a
+        # pool of processes, batch_size individuals per task
+        self.workers = workers
+        self.batch_size = batch_size
+        self.pool = None
+        # Racing. Once a population is ranked, the error of the
+        # individual at this quantile becomes the threshold above
+        # which evaluations of the next generation are aborted
+        self.racing = racing
+        self.threshold = None
+        # Optional epro.gp.instrument.Instrumentation, timing the
+        # stages of evolution and counting evaluations
+        self.monitor = monitor or epro.gp.instrument.NULL
+        # Parent selection scheme, from epro.gp.selection
+        self.selection = selection or \
+            epro.gp.selection.GreedyOverselection()
+        # Parsimony pressure. When ranking, this much is added to the
+        # fitness for each node of an individual
+        self.parsimony = parsimony
 
     def evaluate(self, individual):
-        individual.fitness = self.func(individual, self.training_args)
-        return individual.fitness
+        if self.cache is None:
+            self.monitor.count('evaluations')
+            individual.fitness = computeFitness(self.func, individual,
+                                                self.training_args,
+                                                self.threshold)
+            return individual.fitness
+
+        key = individual.canonicalHash()
+        fitness = self.cachedFitness(key)
+
+        if fitness is None:
+            self.monitor.count('evaluations')
+            fitness = computeFitness(self.func, individual,
+                                     self.training_args, self.threshold)
+            self.cache.put(key, fitness)
+
+        individual.fitness = fitness
+        return fitness
+
+    """
+    Returns the fitness cached for key, if it is still valid. A bound
+    only is while it exceeds the current threshold
+    """
+    def cachedFitness(self, key):
+        fitness = self.cache.get(key)
+
+        if isinstance(fitness, FitnessBound) and \
+                (self.threshold is None or fitness <= self.threshold):
+            return None
+
+        return fitness
 
     def testingError(self, individual):
         return self.func(individual, self.testing_args)
 
     def evaluatePopulation(self, population):
+        self.evaluateIndividuals(population.individuals)
 
-        for individual in population.individuals:
-            self.evaluate(individual)
+    def evaluateIndividuals(self, individuals):
+        if self.workers <= 1 and self.batch_func is None:
+            for individual in individuals:
+                self.evaluate(individual)
+            return
 
-    def rank(self, population):
-        self.evaluatePopulation(population)
-        population.individuals.sort(key = lambda x: x.fitness)
+        self.evaluateBatches(individuals)
 
-    # K tournament with greedy overselection
-    def select(self, population):
-        rule_of_thumb = {1000: 0.32,
-                         2000: 0.16,
-                         4000: 0.08,
-                         8000: 0.04};
-
-        individuals = population.individuals
-        boundary = int(0.32 * len(individuals))
-
-        # 80% of time pick from top best and the rest
-        # from the bottom
-        if random.random() < 0.8:
-            individuals = individuals[:boundary]
+    """
+    Evaluates the individuals with the batch fitness function or in
+    the process pool. Individuals found in the cache are not evaluated,
+    and neither are repeated ones. Fitness values do not depend on the
+    number of workers
+    """
+    def evaluateBatches(self, individuals):
+        # Individuals to evaluate, grouped by hash when caching
+        pending = []
+        groups = {}
+
+        for individual in individuals:
+            if self.cache is None:
+                pending.append(individual)
+                continue
+
+            key = individual.canonicalHash()
+            if key in groups:
+                groups[key].append(individual)
+                continue
+
+            fitness = self.cachedFitness(key)
+            if fitness is None:
+                groups[key] = [individual]
+                pending.append(individual)
+            else:
+                individual.fitness = fitness
+
+        self.monitor.count('evaluations', len(pending))
+
+        if self.workers > 1:
+            fitness_values = self.evaluateParallel(pending)
         else:
-            individuals = individuals[boundary:]
+            fitness_values = computeBatchFitness(self.func, self.batch_func,
+                                                 pending, self.training_args,
+                                                 self.threshold)
+
+        for individual, fitness in zip(pending, fitness_values):
+            if self.cache is None:
+                individual.fitness = fitness
+                continue
 
-        return self.kTournament(individuals, 2)
+            key = individual.canonicalHash()
+            self.cache.put(key, fitness)
+            for duplicate in groups[key]:
+                duplicate.fitness = fitness
 
-    def kTournament(self, individuals, k):
-        return max([random.choice(individuals) for i in range(k)])
+    """
+    Returns the fitness values of the individuals, evaluated in the
+    process pool
+    """
+    def evaluateParallel(self, individuals):
+        self.startPool()
 
+        batch_size = self.batch_size or \
+            max(1, -(-len(individuals) // (4 * self.workers)))
+        batches = [individuals[i:i + batch_size]
+                   for i in range(0, len(individuals), batch_size)]
+        results = self.pool.map(evaluateBatch,
+                                [batchTask(self.threshold, batch)
+                                 for batch in batches])
+
+        return [fitness for batch in results for fitness in batch]
+
+    """
+    Evaluates the individuals in the process pool without waiting.
+    The callback is given their fitness values once they are ready.
+    Returns the multiprocessing.pool.AsyncResult of the evaluation
+    """
+    def submit(self, individuals, callback):
+        self.startPool()
+        self.monitor.count('evaluations', len(individuals))
+
+        return self.pool.apply_async(evaluateBatch,
+                                     (batchTask(self.threshold,
+                                                individuals),),
+                                     callback=callback)
+
+    def startPool(self):
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers, initWorker,
+                                             (self.func, self.batch_func,
+                                              self.training_args))
+
+    """
+    Terminates the worker processes, if any
+    """
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def rank(self, population):
+        with self.monitor.stage('evaluation'):
+            self.evaluatePopulation(population)
+
+        with self.monitor.stage('sorting'):
+            population.individuals.sort(key = self.rankKey)
+
+        if self.racing is not None:
+            individuals = population.individuals
+            index = int(self.racing * (len(individuals) - 1))
+            self.threshold = float(individuals[index].fitness)
+
+    def rankKey(self, individual):
+        if self.parsimony is None:
+            return rankKey(individual)
+
+        return (isinstance(individual.fitness, FitnessBound),
+                individual.fitness + self.parsimony * len(individual))
+
+    """
+    Returns the parents of the next generation of a ranked population,
+    whose next method gives one parent each time
+    """
+    def parents(self, population):
+        return epro.gp.selection.Parents(population.individuals,
+                                         self.selection)
+
+    def select(self, population):
+        return epro.gp.selection.Parents(population.individuals,
+                                         self.selection, 1).next()
+
+"""
+Generational evolution. Every ranked individual is offered to the
+archive, an epro.gp.archive.ParetoArchive, and the most accurate one
+in it is returned. If a checkpoint file is given, the state of the
+run is saved there every checkpoint_interval generations. A run
+restored with epro.gp.checkpoint.load continues from generation
+start with the archive it returned. The metrics of each
+generation are sent to the instrumentation of the evaluator. If an
+epro.gp.optimize.ConstantOptimizer is given, the constants of the
+best individuals are optimized once they are ranked
+"""
 def evolution(population, genetic_operator_set, evaluator,
-              generations, verbose=True):
+              generations, verbose=True, checkpoint=None,
+              checkpoint_interval=CHECKPOINT_INTERVAL, start=0,
+              archive=None, optimizer=None):
     # A generational model is used for survival selection
-    # This list keeps the best individual observed in each generation
-    best_record = []
+    if archive is None:
+        archive = epro.gp.archive.ParetoArchive()
+    best = None
     
-    for i in range(generations):
-        new_generation = []
+    for i in range(start, generations):
+        if checkpoint is not None and i > start and \
+                i % checkpoint_interval == 0:
+            epro.gp.checkpoint.save(checkpoint, population, evaluator,
+                                    archive, i)
 
         evaluator.rank(population)
 
+        if optimizer is not None:
+            with evaluator.monitor.stage('optimization'):
+                optimizer.optimize(population, evaluator)
+
+        ranked = population.individuals
+        best = ranked[0]
+
+        with evaluator.monitor.stage('archive'):
+            archive.addAll(ranked)
+
         if verbose:
+            with evaluator.monitor.stage('testing'):
+                testing_error = evaluator.testingError(best)
+
             print "Generation " + str(i)
-            best = population.individuals[0]
-            best_record += [best]
             print "Training error: " + str(best.fitness)
-            print "Testing error: " + str(evaluator.testingError(best))
+            print "Testing error: " + str(testing_error)
             print "Function: " + str(best)
-            print "Depth: " + str(best.root.height())
+            print "Depth: " + str(best.height())
             print "--------------------------------------"
 
-        while(len(new_generation) < len(population.individuals)):
-            # Select genetic operator, as well as program(s) to apply
-            # the operator, operate, and add to new generation
-            genetic_operator = genetic_operator_set.select()
-            selected_programs = [evaluator.select(population)
+        breed(population, genetic_operator_set, evaluator)
+        evaluator.monitor.endGeneration(i, ranked)
+
+    # The archive is empty if no error was ever finite, then the best
+    # individual of the last ranking is returned
+    if len(archive) == 0:
+        return best
+
+    return archive.best()
+
+"""
+Replaces the individuals of a ranked population by their offspring.
+With a node budget, offspring larger than their share of what is left
+of it are rejected before evaluation and bred again. After
+BUDGET_ATTEMPTS rejections the smallest of them is kept
+"""
+def breed(population, genetic_operator_set, evaluator):
+    monitor = evaluator.monitor
+    parents = evaluator.parents(population)
+    size = len(population.individuals)
+    budget = population.node_budget
+    new_generation = []
+    nodes = 0
+    attempts = 0
+    rejected = []
+
+    while(len(new_generation) < size):
+        # Select genetic operator, as well as program(s) to apply
+        # the operator, operate, and add to new generation
+        genetic_operator = genetic_operator_set.select()
+
+        with monitor.stage('selection'):
+            selected_programs = [parents.next()
                                  for i in range(genetic_operator.arity)]
-            new_generation += list(genetic_operator.apply(*selected_programs))
 
-        # New generation
-        population.individuals = new_generation
-    
-    best_record.sort(key = lambda x: evaluator.evaluate(x))
+        with monitor.stage(genetic_operator.__class__.__name__):
+            offspring = list(genetic_operator.apply(*selected_programs))
+
+        if budget is not None:
+            share = (budget - nodes) // (size - len(new_generation))
+            if max(map(len, offspring)) > share:
+                if attempts < BUDGET_ATTEMPTS:
+                    monitor.count('rejected')
+                    attempts += 1
+                    rejected += offspring
+                    continue
+
+                offspring = [min(rejected + offspring, key = len)]
+
+            attempts = 0
+            rejected = []
+            nodes += sum(map(len, offspring))
+
+        new_generation += offspring
+
+    # New generation
+    population.individuals = new_generation
+
+"""
+Population kept in a heap with the worst individual at its root, for
+steady-state evolution. Inserting an individual replaces the worst
+one or, with a replacement tournament, the worst of tournament_size
+random ones. Individuals are ranked with the key function, and the
+best one inserted so far is remembered
+"""
+class HeapPopulation:
+    def __init__(self, individuals, key=rankKey, replacement='worst',
+                 tournament_size=TOURNAMENT_SIZE):
+        self.key = key
+        self.replacement = replacement
+        self.tournament_size = tournament_size
+        self.best = min(individuals, key = key)
+        # Entries are ordered worst first. The counter breaks ties, so
+        # individuals are never compared
+        self.heap = [(worstKey(key(individual)), i, individual)
+                     for i, individual in enumerate(individuals)]
+        heapq.heapify(self.heap)
+        self.counter = len(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def insert(self, individual):
+        entry = (worstKey(self.key(individual)), self.counter, individual)
+        self.counter += 1
+
+        if self.replacement == 'worst':
+            heapq.heapreplace(self.heap, entry)
+        else:
+            heapReplaceLoser(self.heap, entry, self.tournament_size)
+
+        if self.key(individual) < self.key(self.best):
+            self.best = individual
+
+    # Winners of count parent tournaments
+    def parents(self, count):
+        return heapTournament(self.heap, count, self.tournament_size,
+                              self.key)
+
+    def individuals(self):
+        return [entry[2] for entry in self.heap]
+
+    def ranked(self):
+        return sorted(self.individuals(), key = self.key)
+
+# At least count offspring of the parents, bred with operators of the
+# set. Each operator gives at least as many offspring as it takes
+# parents, so 2 * count parents are always enough
+def breedOffspring(genetic_operator_set, parents, count, monitor):
+    offspring = []
+
+    while len(offspring) < count:
+        genetic_operator = genetic_operator_set.select()
+        selected_programs = parents[:genetic_operator.arity]
+        parents = parents[genetic_operator.arity:]
+
+        with monitor.stage(genetic_operator.__class__.__name__):
+            offspring += list(genetic_operator.apply(*selected_programs))
+
+    return offspring
+
+# Reports the progress of steady-state evolution once every population
+# size insertions
+def reportSteadyState(heap, inserted, previous, monitor, verbose):
+    generation = inserted // len(heap)
+    if generation == previous // len(heap):
+        return
+
+    if verbose:
+        print "Generation " + str(generation)
+        print "Training error: " + str(heap.best.fitness)
+        print "Function: " + str(heap.best)
+        print "--------------------------------------"
+
+    monitor.endGeneration(generation, heap.individuals(), heap.best)
+
+"""
+Steady-state evolution. Offspring are bred batch_size at a time,
+evaluated, and inserted into a HeapPopulation, so the population is
+never sorted and only offspring are evaluated. Parents are chosen by
+k tournament. Runs last until at least the given number of offspring
+has been evaluated. Every population size offspring count as a
+generation for reports. Returns the best individual, and leaves the
+population ranked
+"""
+def steadyStateEvolution(population, genetic_operator_set, evaluator,
+                         evaluations, batch_size=1, replacement='worst',
+                         tournament_size=TOURNAMENT_SIZE, verbose=True):
+    monitor = evaluator.monitor
+
+    evaluator.rank(population)
+    heap = HeapPopulation(population.individuals, evaluator.rankKey,
+                          replacement, tournament_size)
+    inserted = 0
+
+    while inserted < evaluations:
+        with monitor.stage('selection'):
+            parents = heap.parents(2 * batch_size)
+
+        offspring = breedOffspring(genetic_operator_set, parents,
+                                   batch_size, monitor)
+
+        with monitor.stage('evaluation'):
+            evaluator.evaluateIndividuals(offspring)
+
+        with monitor.stage('replacement'):
+            for individual in offspring:
+                heap.insert(individual)
+
+        # Crossover may give more offspring than batch_size, and all
+        # of them were evaluated
+        previous = inserted
+        inserted += len(offspring)
+        reportSteadyState(heap, inserted, previous, monitor, verbose)
+
+    population.individuals = heap.ranked()
+
+    return heap.best
+
+"""
+Asynchronous steady-state evolution. Batches of offspring are sent to
+the process pool of the evaluator as soon as they are bred, keeping
+up to pending batches per worker in flight, and each one is inserted
+into the population as soon as its evaluation finishes, so the master
+breeds while workers evaluate and slow batches hold nobody back.
+Individuals found in the fitness cache are inserted right away.
+Results depend on the order in which evaluations finish, so runs are
+not reproducible. Without a process pool this is steadyStateEvolution
+"""
+def asynchronousEvolution(population, genetic_operator_set, evaluator,
+                          evaluations, batch_size=1, replacement='worst',
+                          tournament_size=TOURNAMENT_SIZE, pending=2,
+                          verbose=True):
+    if evaluator.workers <= 1:
+        return steadyStateEvolution(population, genetic_operator_set,
+                                    evaluator, evaluations, batch_size,
+                                    replacement, tournament_size, verbose)
+
+    monitor = evaluator.monitor
+
+    evaluator.rank(population)
+    heap = HeapPopulation(population.individuals, evaluator.rankKey,
+                          replacement, tournament_size)
+    # Batches in flight by number, and their results as they finish
+    in_flight = {}
+    finished = Queue.Queue()
+    submitted = 0
+    inserted = 0
+
+    while inserted < evaluations:
+        # Keeps the workers busy
+        while len(in_flight) < pending * evaluator.workers and \
+                submitted < evaluations:
+            with monitor.stage('selection'):
+                parents = heap.parents(2 * batch_size)
+
+            offspring = breedOffspring(genetic_operator_set, parents,
+                                       batch_size, monitor)
+            submitted += len(offspring)
+
+            uncached = []
+            for individual in offspring:
+                if evaluator.cache is None:
+                    uncached.append(individual)
+                    continue
+
+                fitness = evaluator.cachedFitness(
+                    individual.canonicalHash())
+                if fitness is None:
+                    uncached.append(individual)
+                else:
+                    individual.fitness = fitness
+                    heap.insert(individual)
+
+            # Cached offspring were inserted already
+            previous = inserted
+            inserted += len(offspring) - len(uncached)
+            reportSteadyState(heap, inserted, previous, monitor, verbose)
+
+            if uncached:
+                number = submitted
+                in_flight[number] = (uncached, evaluator.submit(
+                    uncached,
+                    lambda values, number=number:
+                        finished.put((number, values))))
+
+        if not in_flight:
+            continue
+
+        with monitor.stage('waiting'):
+            number, fitness_values = waitFinished(finished, in_flight)
+        individuals = in_flight.pop(number)[0]
+
+        with monitor.stage('replacement'):
+            for individual, fitness in zip(individuals, fitness_values):
+                individual.fitness = fitness
+                if evaluator.cache is not None:
+                    evaluator.cache.put(individual.canonicalHash(), fitness)
+                heap.insert(individual)
+
+        previous = inserted
+        inserted += len(individuals)
+        reportSteadyState(heap, inserted, previous, monitor, verbose)
+
+    population.individuals = heap.ranked()
+
+    return heap.best
+
+# Returns the next finished batch. Batches whose evaluation failed never
+# finish, so their errors are raised instead
+def waitFinished(finished, in_flight):
+    while True:
+        try:
+            return finished.get(timeout=1.0)
+        except Queue.Empty:
+            for individuals, result in in_flight.values():
+                if result.ready() and not result.successful():
+                    result.get()
+
+# Heap key of an individual with the given rank key. The smallest key
+# is the one of the worst individual
+def worstKey(key):
+    bounded, fitness = key
+    return (not bounded, -fitness)
+
+# Winners of count tournaments among k individuals of the heap, ranked
+# with the key function
+def heapTournament(heap, count, k, key=rankKey):
+    state = numpy.random.RandomState(random.getrandbits(32))
+    positions = state.randint(0, len(heap), (count, k)).tolist()
+
+    return [min([heap[j][2] for j in tournament], key = key)
+            for tournament in positions]
+
+# Replaces the worst of k random entries of the heap by entry
+def heapReplaceLoser(heap, entry, k):
+    position = min([random.randrange(len(heap)) for i in range(k)],
+                   key = lambda j: heap[j][0])
+    heap[position] = entry
 
-    return best_record[0]
+    # The new entry may need to go up or down the heap
+    heapq._siftup(heap, position)
+    heapq._siftdown(heap, 0, position)
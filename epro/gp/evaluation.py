@@ -0,0 +1,448 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+import array
+
+import numpy
+
+import epro.gp.cache
+import epro.gp.core
+import epro.gp.instrument
+import epro.gp.protected
+import epro.gp.simplify
+import epro.gp.tree
+
+# Building blocks of compiled trees. Every compiled node is a closure
+# taking the columns of the variables, the output buffers and the
+# cache of subtree outputs (which may be None)
+
+def compileConstant(value):
+    return lambda variables, buffers, outputs: value
+
+def compileVariable(name):
+    return lambda variables, buffers, outputs: variables[name]
+
+def compileUnary(function, argument, slot):
+    return lambda variables, buffers, outputs: function(
+        argument(variables, buffers, outputs), buffers[slot])
+
+def compileBinary(function, left, right, slot):
+    return lambda variables, buffers, outputs: function(
+        left(variables, buffers, outputs),
+        right(variables, buffers, outputs), buffers[slot])
+
+def compileFunction(function, arguments, slot):
+    return lambda variables, buffers, outputs: function(
+        *([argument(variables, buffers, outputs) for argument in arguments]
+          + [buffers[slot]]))
+
+def compileCached(code, key):
+    def cached(variables, buffers, outputs):
+        if outputs is None:
+            return code(variables, buffers, outputs)
+
+        output = outputs.get(key)
+        if output is None:
+            output = code(variables, buffers, outputs)
+            outputs.put(key, output)
+
+        return output
+
+    return cached
+
+"""
+Evaluates syntactic trees over whole data sets at once. Each variable
+of the data set is a column array and every function node is computed
+with a single array operation, so the cost of interpreting the tree is
+paid once per individual instead of once per record.
+Trees are compiled into closures calling the array functions, and the
+closures of the last compiled_size trees are kept. Unless simplify
+is false, trees are compiled after epro.gp.simplify.simplify, which
+does not change their output.
+If an epro.gp.cache.OutputCache is given the outputs of subtrees are
+kept, so an offspring only computes the nodes its genetic operator
+changed and their ancestors.
+If chunk_size is given, records are processed in chunks of that
+size. Buffers then take memory in proportion to the chunk and not to
+the data set, and when racing hopeless individuals are abandoned
+early. Subtree outputs are only cached if there is a single chunk.
+If scaling is true errors are those of the optimal linear scaling of
+the output of each tree over this data set, a + b * output, computed
+in closed form. If it is another ArrayEvaluator, trees are scaled
+with the coefficients fitted over its data set before evaluation
+"""
+class ArrayEvaluator:
+    def __init__(self, variables, target,
+                 functions=epro.gp.protected.ArrayGPFunction,
+                 outputs=None, compiled_size=2000, chunk_size=None,
+                 monitor=None, simplify=True, scaling=None):
+        self.variables = variables # Maps terminal symbols to columns
+        self.target = target       # Expected output for each record
+        self.functions = functions # Array versions of the functions
+        self.outputs = outputs     # Cache of subtree outputs
+        self.size = len(target)
+        self.chunk_size = min(chunk_size or self.size, self.size)
+        self.error = numpy.empty(self.chunk_size)
+        # Output buffers are allocated once and reused by every
+        # evaluation. One is needed per level of nesting
+        self.buffers = []
+        # Compiled trees by canonical hash. Modifying a tree changes
+        # its hash, so stale code is never used
+        self.compiled = epro.gp.cache.LRUCache(compiled_size)
+        # Optional epro.gp.instrument.Instrumentation timing compilation
+        self.monitor = monitor or epro.gp.instrument.NULL
+        # Trees are simplified before they are compiled. Identities
+        # like sub(x, x) only hold for variables that are finite in
+        # every record
+        self.simplify = simplify
+        if simplify:
+            self.finite = frozenset(
+                [name for name, column in self.variables.items()
+                 if self.isFinite(column)])
+        self.scaling = scaling
+
+    def buffer(self, slot):
+        while len(self.buffers) <= slot:
+            self.buffers.append(numpy.empty(self.chunk_size))
+
+        return self.buffers[slot]
+
+    """
+    Tells if every record of the column is finite. Columns are read a
+    chunk at a time, so memory-mapped ones are never loaded whole
+    """
+    def isFinite(self, column):
+        for start, stop in self.chunks():
+            if not numpy.isfinite(column[start:stop]).all():
+                return False
+
+        return True
+
+    """
+    Returns the bounds of the chunks of records
+    """
+    def chunks(self):
+        return [(start, min(start + self.chunk_size, self.size))
+                for start in xrange(0, self.size, self.chunk_size or 1)]
+
+    """
+    Returns the columns, the buffers and the output cache to use
+    for the records from start to stop
+    """
+    def chunkArguments(self, start, stop):
+        if start == 0 and stop == self.size:
+            return self.variables, self.buffers, self.outputs
+
+        # Subtree outputs are cached for the whole data set only
+        variables = dict((name, column[start:stop])
+                         for name, column in self.variables.items())
+        buffers = [buffer[:stop - start] for buffer in self.buffers]
+
+        return variables, buffers, None
+
+    """
+    Returns the output of the tree for every record. With a single
+    chunk, the result may be one of the internal buffers, so it is
+    only valid until the next evaluation
+    """
+    def evaluate(self, tree):
+        code = self.compile(tree)
+
+        if self.chunk_size == self.size:
+            with numpy.errstate(all='ignore'):
+                return code(self.variables, self.buffers, self.outputs)
+
+        output = numpy.empty(self.size)
+
+        for start, stop in self.chunks():
+            with numpy.errstate(all='ignore'):
+                output[start:stop] = code(*self.chunkArguments(start, stop))
+
+        return output
+
+    """
+    Returns the compiled code of the tree, from the cache if possible
+    """
+    def compile(self, tree):
+        key = tree.canonicalHash()
+        code = self.compiled.get(key)
+
+        if code is None:
+            with self.monitor.stage('compilation'):
+                if self.simplify:
+                    tree = epro.gp.simplify.simplify(tree, self.finite,
+                                                     self.functions)
+                code = self.compileTree(tree)
+            self.compiled.put(key, code)
+
+        return code
+
+    """
+    Builds the closure computing the output of the tree. The output of
+    a function is written in the buffer of its slot. Its i-th argument
+    uses slot + i, so it never overwrites the outputs of the arguments
+    on its left
+    """
+    def compileTree(self, tree):
+        symbols = tree.parameters.symbols
+        count = len(tree.opcodes)
+
+        # Slots are assigned in pre-order
+        slots = [0] * count
+        pending = []
+
+        for i in xrange(count):
+            if pending:
+                slots[i] = pending.pop()
+            for j in reversed(range(tree.arities[i])):
+                pending.append(slots[i] + j)
+
+        self.buffer(max(slots))
+
+        # In reversed pre-order the arguments of a function are on top
+        # of the stack, leftmost first
+        stack = []
+
+        for i in reversed(xrange(count)):
+            opcode = tree.opcodes[i]
+            arity = tree.arities[i]
+
+            if opcode == epro.gp.tree.CONSTANT:
+                stack.append(compileConstant(tree.constants[i]))
+                continue
+            elif not arity:
+                stack.append(compileVariable(symbols[opcode][0]))
+                continue
+
+            function = getattr(self.functions, symbols[opcode][0])
+            arguments = [stack.pop() for j in range(arity)]
+
+            if arity == 1:
+                code = compileUnary(function, arguments[0], slots[i])
+            elif arity == 2:
+                code = compileBinary(function, arguments[0], arguments[1],
+                                     slots[i])
+            else:
+                code = compileFunction(function, arguments, slots[i])
+
+            # Subtrees are identified by their nodes
+            end = tree.subtreeEnd(i)
+            if self.outputs is not None and \
+                    end - i >= self.outputs.min_size:
+                key = (tree.opcodes[i:end].tostring() +
+                       tree.constants[i:end].tostring())
+                code = compileCached(code, key)
+
+            stack.append(code)
+
+        return stack[0]
+
+    """
+    Sum of squared errors of the tree over the whole data set.
+    Overflowing and undefined outputs are worth an infinite error.
+    If a bound is given, evaluation stops as soon as the error of
+    the records seen so far exceeds it, and that partial error is
+    returned as an epro.gp.core.FitnessBound
+    """
+    def sse(self, tree, bound=None):
+        return self.populationSSE([tree], bound)[0]
+
+    """
+    Sum of squared errors of every tree. Chunks are visited once,
+    and all trees are evaluated over a chunk before moving to the
+    next one, so each record is read once even if the data set is
+    mapped from disk. Errors are bounded as in sse
+    """
+    def populationSSE(self, trees, bound=None):
+        if isinstance(self.scaling, ArrayEvaluator):
+            trees = [self.scaling.scaledTree(tree) for tree in trees]
+
+        codes = [self.compile(tree) for tree in trees]
+        errors = [0.0] * len(trees)
+        # Moments of the outputs seen so far, when scaling. The error
+        # of the best scaling of part of the records is a lower bound
+        # of the error over all of them
+        moments = [None] * len(trees)
+        # Trees whose evaluation goes on
+        active = range(len(trees))
+
+        for start, stop in self.chunks():
+            arguments = self.chunkArguments(start, stop)
+            target = self.target[start:stop]
+
+            if self.scaling is True:
+                target_moments = centeredMoments(target)
+
+            for i in active:
+                if self.scaling is True:
+                    moments[i] = mergeMoments(
+                        moments[i],
+                        self.chunkMoments(codes[i], arguments,
+                                          target_moments))
+                    errors[i] = scaledError(moments[i])
+                else:
+                    errors[i] += self.chunkSSE(codes[i], arguments, target)
+
+            if stop == self.size:
+                break
+
+            # An infinite error will not get any better
+            active = [i for i in active if errors[i] != float('inf')]
+
+            if bound is not None:
+                for i in active:
+                    if errors[i] > bound:
+                        errors[i] = epro.gp.core.FitnessBound(errors[i])
+                active = [i for i in active if errors[i] <= bound]
+
+        return errors
+
+    """
+    Returns the coefficients a and b of the linear scaling of the
+    output of the tree with the least squared error over the data set.
+    Trees with undefined outputs are not scaled
+    """
+    def coefficients(self, tree):
+        code = self.compile(tree)
+        moments = None
+
+        for start, stop in self.chunks():
+            target = self.target[start:stop]
+            moments = mergeMoments(
+                moments,
+                self.chunkMoments(code, self.chunkArguments(start, stop),
+                                  centeredMoments(target)))
+
+        if not numpy.isfinite(moments).all():
+            return 0.0, 1.0
+
+        count, mean, target_mean, variance, target_variance, covariance = \
+            moments
+        b = covariance / variance if varies(moments) else 0.0
+
+        return target_mean - b * mean, b
+
+    """
+    Returns the tree add(a, mul(b, tree)) with the coefficients of its
+    linear scaling. The function set must have add and mul
+    """
+    def scaledTree(self, tree):
+        a, b = self.coefficients(tree)
+        names = [symbol[0] for symbol in tree.parameters.symbols]
+        constant = epro.gp.tree.CONSTANT
+
+        scaled = epro.gp.tree.Tree(tree.parameters, tree.max_height)
+        scaled.setNodes(
+            array.array('h', [names.index('add'), constant,
+                              names.index('mul'), constant]) + tree.opcodes,
+            array.array('B', [2, 0, 2, 0]) + tree.arities,
+            array.array('d', [0.0, a, 0.0, b]) + tree.constants)
+
+        return scaled
+
+    """
+    Moments of the output of the tree over one chunk of records, given
+    those of the target. See centeredMoments
+    """
+    def chunkMoments(self, code, arguments, target_moments):
+        count, target_mean, target_variance, target = target_moments
+        deviation = self.error[:count]
+
+        with numpy.errstate(all='ignore'):
+            output = code(*arguments)
+            mean = numpy.mean(output)
+            numpy.subtract(output, mean, deviation)
+            variance = float(numpy.dot(deviation, deviation))
+            covariance = float(numpy.dot(deviation, target))
+
+        return (count, float(mean), target_mean, variance, target_variance,
+                covariance)
+
+    """
+    Sum of squared errors over one chunk of records
+    """
+    def chunkSSE(self, code, arguments, target):
+        error = self.error[:len(target)]
+
+        with numpy.errstate(all='ignore'):
+            output = code(*arguments)
+            numpy.subtract(output, target, error)
+            sse = float(numpy.dot(error, error))
+
+        if numpy.isnan(sse):
+            return float('inf')
+
+        return sse
+
+# Count, mean, sum of squared deviations and deviations of the target
+# over a chunk of records
+def centeredMoments(target):
+    mean = float(numpy.mean(target))
+    deviation = target - mean
+    return (len(target), mean, float(numpy.dot(deviation, deviation)),
+            deviation)
+
+# Merges the moments of the outputs over two sets of records. Moments
+# are the count, the means of the output and of the target, their sums
+# of squared deviations and the sum of the products of deviations
+def mergeMoments(first, second):
+    if first is None:
+        return second
+
+    count1, mean1, target_mean1, variance1, target_variance1, \
+        covariance1 = first
+    count2, mean2, target_mean2, variance2, target_variance2, \
+        covariance2 = second
+
+    count = count1 + count2
+    delta = mean2 - mean1
+    target_delta = target_mean2 - target_mean1
+    weight = float(count1) * count2 / count
+
+    return (count,
+            mean1 + delta * count2 / count,
+            target_mean1 + target_delta * count2 / count,
+            variance1 + variance2 + delta * delta * weight,
+            target_variance1 + target_variance2 +
+            target_delta * target_delta * weight,
+            covariance1 + covariance2 + delta * target_delta * weight)
+
+# Sum of squared errors of the best linear scaling, from the moments.
+# Undefined outputs are worth an infinite error
+def scaledError(moments):
+    count, mean, target_mean, variance, target_variance, covariance = \
+        moments
+
+    if not numpy.isfinite(moments).all():
+        return float('inf')
+    if not varies(moments):
+        return target_variance
+
+    return max(target_variance - covariance * covariance / variance, 0.0)
+
+# Outputs varying less than this, relative to their mean, are taken
+# as constant. Scaling rounding errors would be meaningless
+RELATIVE_VARIATION = 1e-10
+
+def varies(moments):
+    count, mean, target_mean, variance = moments[:4]
+    return variance > count * (RELATIVE_VARIATION * mean) ** 2 and \
+        variance > 0
@@ -0,0 +1,170 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+import collections
+import json
+import resource
+import time
+
+"""
+Times a stage of evolution when used in a with statement
+"""
+class Stage:
+    def __init__(self, times, name):
+        self.times = times
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *exception):
+        self.times[self.name] += time.time() - self.start
+
+class NullStage:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exception):
+        pass
+
+"""
+Instrumentation that does nothing. It is used when no other is given
+"""
+class NullInstrumentation:
+    def stage(self, name):
+        return NULL_STAGE
+
+    def count(self, name, amount=1):
+        pass
+
+    def watchCache(self, name, cache):
+        pass
+
+    def endGeneration(self, generation, individuals, best=None):
+        pass
+
+    def close(self):
+        pass
+
+NULL_STAGE = NullStage()
+NULL = NullInstrumentation()
+
+"""
+Collects metrics of every generation: the time spent in each stage,
+counters of events, hits and misses of the watched caches, the
+distribution of tree sizes and the peak memory used. Stages may
+nest, the time of the inner ones is also counted in the outer ones.
+Records are sent to the sink, which has a write and a close method
+"""
+class Instrumentation:
+    def __init__(self, sink):
+        self.sink = sink
+        self.times = collections.defaultdict(float)
+        self.counters = collections.defaultdict(int)
+        self.caches = {}
+        self.start = time.time()
+
+    def stage(self, name):
+        return Stage(self.times, name)
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    """
+    Adds the hits and misses of the cache, which has hits and misses
+    attributes, to the records of the generations that follow
+    """
+    def watchCache(self, name, cache):
+        self.caches[name] = [cache, cache.hits, cache.misses]
+
+    """
+    Sends the record of a generation. The best individual is the
+    first one, unless it is given
+    """
+    def endGeneration(self, generation, individuals, best=None):
+        if best is None:
+            best = individuals[0]
+
+        sizes = sorted([len(individual) for individual in individuals])
+        now = time.time()
+
+        record = {'generation': generation,
+                  'seconds': now - self.start,
+                  'stages': dict(self.times),
+                  'counters': dict(self.counters),
+                  'caches': {},
+                  'sizes': treeSizes(sizes),
+                  'best_fitness': best.fitness,
+                  'max_rss_kb': resource.getrusage(
+                      resource.RUSAGE_SELF).ru_maxrss}
+
+        for name, watched in self.caches.items():
+            cache, hits, misses = watched
+            record['caches'][name] = {'hits': cache.hits - hits,
+                                      'misses': cache.misses - misses}
+            watched[1:] = [cache.hits, cache.misses]
+
+        self.sink.write(record)
+
+        self.times.clear()
+        self.counters.clear()
+        self.start = now
+
+    def close(self):
+        self.sink.close()
+
+# Summary of the sorted sizes of the trees in a population
+def treeSizes(sizes):
+    if not sizes:
+        return {}
+
+    return {'min': sizes[0],
+            'median': sizes[len(sizes) // 2],
+            'p90': sizes[int(0.9 * (len(sizes) - 1))],
+            'max': sizes[-1],
+            'mean': float(sum(sizes)) / len(sizes),
+            'total': sum(sizes)}
+
+"""
+Writes records as lines of JSON. Records are buffered and written
+buffer_size at a time
+"""
+class JSONLSink:
+    def __init__(self, filename, buffer_size=100):
+        self.file = open(filename, 'a')
+        self.buffer_size = buffer_size
+        self.buffer = []
+
+    def write(self, record):
+        self.buffer.append(json.dumps(record, sort_keys=True))
+
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write('\n'.join(self.buffer) + '\n')
+            self.file.flush()
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
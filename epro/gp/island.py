@@ -0,0 +1,204 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+import multiprocessing
+import Queue
+import random
+import sys
+import traceback
+
+import epro.gp.archive
+import epro.gp.core
+import epro.gp.serialize
+
+# Default parameter values
+MIGRATION_INTERVAL = 10
+MIGRATION_SIZE = 5
+
+"""
+Returns, for each island, the islands its emigrants go to
+"""
+def neighbours(islands, topology):
+    if topology == 'ring':
+        return [[(i + 1) % islands] if islands > 1 else []
+                for i in range(islands)]
+    elif topology == 'full':
+        return [[j for j in range(islands) if j != i]
+                for i in range(islands)]
+
+    raise ValueError("Unknown topology " + str(topology))
+
+"""
+Evolves one island. Every migration_interval generations the best
+migration_size individuals are sent to the neighbouring islands, and
+the worst ones are replaced by the immigrants from the islands this
+one is a neighbour of. The archive of the island keeps up to capacity
+individuals, and its front is put in results, or the best individual
+of the last ranking if the archive is empty. If evolution fails the
+traceback is put there instead, so the run does not wait for it.
+Individuals travel between processes encoded by epro.gp.serialize
+"""
+def runIsland(index, population, genetic_operator_set, evaluator,
+              generations, seed, inbox, outboxes, sources,
+              migration_interval, migration_size, capacity, results,
+              verbose):
+    try:
+        front = evolveIsland(index, population, genetic_operator_set,
+                             evaluator, generations, seed, inbox, outboxes,
+                             sources, migration_interval, migration_size,
+                             capacity, verbose)
+    except Exception:
+        results.put((index, traceback.format_exc(), None))
+    else:
+        results.put((index, None, front))
+
+# Body of runIsland. Returns the encoded front of the island
+def evolveIsland(index, population, genetic_operator_set, evaluator,
+                 generations, seed, inbox, outboxes, sources,
+                 migration_interval, migration_size, capacity, verbose):
+    random.seed(seed)
+    parameters = population.tree_parameters
+    archive = epro.gp.archive.ParetoArchive(capacity)
+
+    for generation in range(1, generations + 1):
+        evaluator.rank(population)
+        individuals = population.individuals
+        archive.addAll(individuals)
+
+        if generation % migration_interval == 0 and generation < generations:
+            # Whole lines are written so that islands do not mix them
+            if verbose:
+                sys.stdout.write("Island %d, generation %d. "
+                                 "Training error: %s\n" %
+                                 (index, generation, individuals[0].fitness))
+                sys.stdout.flush()
+
+            emigrants = epro.gp.serialize.encodeTrees(
+                individuals[:migration_size], parameters)
+            for outbox in outboxes:
+                outbox.put(emigrants)
+
+            immigrants = []
+            for i in range(sources):
+                immigrants += epro.gp.serialize.decodeTrees(inbox.get(),
+                                                            parameters)
+
+            # Immigrants keep their fitness, the population is ranked
+            # again for selection
+            if immigrants:
+                individuals[-len(immigrants):] = immigrants
+                individuals.sort(key = evaluator.rankKey)
+
+        best = individuals[0]
+
+        epro.gp.core.breed(population, genetic_operator_set, evaluator)
+
+    evaluator.close()
+
+    return epro.gp.serialize.encodeTrees(archive.individuals or [best],
+                                         parameters)
+
+# Returns the results of every island. If an island fails, or dies
+# without a result, the others are terminated and an error is raised
+def collectResults(results, processes):
+    collected = []
+
+    while len(collected) < len(processes):
+        try:
+            index, error, front = results.get(timeout=1.0)
+        except Queue.Empty:
+            # Islands that end normally have put their result already
+            for index, process in enumerate(processes):
+                if not process.is_alive() and process.exitcode != 0:
+                    error = "Island %d died with exit code %s" % \
+                        (index, process.exitcode)
+                    break
+            else:
+                continue
+
+        if error is not None:
+            for process in processes:
+                process.terminate()
+                process.join()
+            raise RuntimeError("Island %d failed\n%s" % (index, error))
+
+        collected.append((index, front))
+
+    return collected
+
+"""
+Island model. Each population evolves in its own process and
+exchanges its best individuals with other islands periodically. In
+the ring topology each island sends emigrants to the next one, in
+the full topology to every other island. Islands are seeded from the
+random module, so runs are reproducible. The fronts of the islands
+are merged into archive, an epro.gp.archive.ParetoArchive, and the
+most accurate individual in it is returned, or the best individual
+the islands sent if it is empty. If an island fails the
+others are terminated, and a RuntimeError with its traceback is raised
+"""
+def islandEvolution(populations, genetic_operator_set, evaluator,
+                    generations, migration_interval=MIGRATION_INTERVAL,
+                    migration_size=MIGRATION_SIZE, topology='ring',
+                    verbose=True, archive=None):
+    if archive is None:
+        archive = epro.gp.archive.ParetoArchive()
+
+    islands = len(populations)
+    destinations = neighbours(islands, topology)
+    sources = [sum([i in destinations[j] for j in range(islands)])
+               for i in range(islands)]
+    inboxes = [multiprocessing.Queue() for i in range(islands)]
+    results = multiprocessing.Queue()
+    seeds = [random.getrandbits(32) for i in range(islands)]
+
+    processes = []
+    for i in range(islands):
+        outboxes = [inboxes[j] for j in destinations[i]]
+        process = multiprocessing.Process(
+            target=runIsland,
+            args=(i, populations[i], genetic_operator_set, evaluator,
+                  generations, seeds[i], inboxes[i], outboxes, sources[i],
+                  migration_interval, migration_size, archive.capacity,
+                  results, verbose))
+        process.start()
+        processes.append(process)
+
+    # Results are collected before joining, a process does not end
+    # until its queues are flushed
+    fronts = collectResults(results, processes)
+
+    for process in processes:
+        process.join()
+
+    # Fronts are merged in island order, so runs are reproducible
+    fronts.sort()
+    individuals = []
+    for i, encoded in fronts:
+        individuals += epro.gp.serialize.decodeTrees(
+            encoded, populations[i].tree_parameters)
+    archive.addAll(individuals)
+
+    # No error was ever finite
+    if len(archive) == 0:
+        return min(individuals, key = epro.gp.core.rankKey)
+
+    return archive.best()
@@ -19,7 +19,6 @@
 #
 #========================================================================
 
-import copy
 import random
 
 class CDF:
@@ -74,7 +73,7 @@ class GeneticReproduction(AbstractGeneticOperator):
         AbstractGeneticOperator.__init__(self, 1)
 
     def apply(self, *programs):
-        return (copy.deepcopy(programs[0]),)
+        return (programs[0].copy(),)
 
 """
 Crossover genetic operator
@@ -82,41 +81,48 @@ Crossover genetic operator
 class GeneticCrossover(AbstractGeneticOperator):
     """
     If bloat is false the size of the offspring will never be larger
-    than that of their parents
+    than that of their parents. Offspring with more than max_size
+    nodes are rejected, and their parent is copied instead
     """
-    def __init__(self, bloat=False):
+    def __init__(self, bloat=False, max_size=None):
         AbstractGeneticOperator.__init__(self, 2)
         self.bloat = bloat
+        self.max_size = max_size
 
     """
     Apply the crossover operator
     """
     def apply(self, *programs):
         # Clone both parents
-        offspring1 = copy.deepcopy(programs[0])
-        offspring2 = copy.deepcopy(programs[1])
+        offspring1 = programs[0].copy()
+        offspring2 = programs[1].copy()
 
         # Randomly pick first subtree
-        subtree1 = offspring1.randomNode()
+        node1 = offspring1.randomNode()
 
         # Bloat control. If bloat is allowed any node from the
         # second parent can be chosen
         if self.bloat:
-            subtree2 = offspring2.randomNode()
+            node2 = offspring2.randomNode()
         else:
-            max_depth = offspring2.max_height - subtree1.height()
-            max_height = offspring1.max_height - subtree1.depth()
-            subtree2 = offspring2.randomNode(max_depth, max_height)
+            max_depth = offspring2.max_height - offspring1.height(node1)
+            max_height = offspring1.max_height - offspring1.depth(node1)
+            node2 = offspring2.randomNode(max_depth, max_height)
 
-        # Clone one of the subtrees
-        clone = copy.copy(subtree2)
-        # Update children references
-        for child in clone.children:
-            child.parent = clone
+        subtree1 = offspring1.subtree(node1)
+        subtree2 = offspring2.subtree(node2)
+
+        # Sizes are checked before swapping, so oversized offspring
+        # are never built
+        growth = len(subtree2) - len(subtree1)
+        swap1 = self.fits(len(offspring1) + growth)
+        swap2 = self.fits(len(offspring2) - growth)
 
         # This'll do the swapping
-        offspring1.substituteNode(subtree1, clone)
-        offspring2.substituteNode(subtree2, subtree1)
+        if swap1:
+            offspring1.substituteNode(node1, subtree2)
+        if swap2:
+            offspring2.substituteNode(node2, subtree1)
 
         if offspring1.height() > offspring1.max_height or\
                 offspring2.height() > offspring2.max_height:
@@ -124,35 +130,45 @@ class GeneticCrossover(AbstractGeneticOperator):
 
         return (offspring1, offspring2)
 
+    def fits(self, size):
+        return self.max_size is None or size <= self.max_size
+
 """
 Mutation genetic operator
 """
 class GeneticMutation(AbstractGeneticOperator):
 
-    def __init__(self, bloat=False):
+    def __init__(self, bloat=False, max_size=None):
         AbstractGeneticOperator.__init__(self, 1)
         self.bloat = bloat
+        self.max_size = max_size
  
     """
     If bloat is false the size of the offspring will never be larger
-    than that of their parents
+    than that of their parents. Offspring with more than max_size
+    nodes are rejected, and their parent is copied instead
     """
     def apply(self, *programs):
         # Clone parent
-        offspring = copy.deepcopy(programs[0])
+        offspring = programs[0].copy()
         # Pick random subtree
-        subtree_root = offspring.randomNode()
+        node = offspring.randomNode()
 
         # Bloat control. If bloat allowed the new subtree can be
         # one level higher than old subtree
         if self.bloat:
-            max_height = subtree_root.height() + 1
+            max_height = offspring.height(node) + 1
         else:
-            max_height = offspring.max_height - subtree_root.depth()
+            max_height = offspring.max_height - offspring.depth(node)
 
         # Substitute for a random subtree
-        offspring.substituteNode(subtree_root,
-                                 offspring.randomInit(max_height).root)
+        subtree = offspring.randomInit(max_height)
+        size = len(offspring) - offspring.sizes[node] + len(subtree)
+
+        if self.max_size is not None and size > self.max_size:
+            return (offspring,)
+
+        offspring.substituteNode(node, subtree)
             
         if offspring.height() > offspring.max_height:
             print "Mutation bloat"
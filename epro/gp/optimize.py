@@ -0,0 +1,95 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+import array
+import random
+
+import numpy
+
+import epro.gp.tree
+
+"""
+Local optimization of the constants of the best individuals of a
+ranked population. At each iteration every elite gets candidates
+whose constants are perturbed with normal noise, and all of them are
+evaluated at once as a batch. An elite is replaced by its best
+candidate if it improves on it. The noise of an elite, relative to
+the magnitude of its constants, doubles after an improvement and is
+halved otherwise
+"""
+class ConstantOptimizer:
+    def __init__(self, elites=5, candidates=10, iterations=5, step=0.1):
+        self.elites = elites
+        self.candidates = candidates
+        self.iterations = iterations
+        self.step = step
+
+    """
+    Optimizes the constants of the elites of the population, which
+    is ranked again afterwards. The noise is drawn by a generator
+    seeded from the random module, so runs are reproducible
+    """
+    def optimize(self, population, evaluator):
+        individuals = population.individuals
+        state = numpy.random.RandomState(random.getrandbits(32))
+
+        # Positions of the elites with constants, and of their constants
+        elites = []
+        for position in range(min(self.elites, len(individuals))):
+            tree = individuals[position]
+            nodes = numpy.flatnonzero(
+                numpy.frombuffer(tree.opcodes, numpy.int16) ==
+                epro.gp.tree.CONSTANT)
+            if len(nodes):
+                elites.append([position, nodes, self.step])
+
+        for i in range(self.iterations):
+            candidates = []
+
+            for position, nodes, step in elites:
+                tree = individuals[position]
+                values = numpy.frombuffer(tree.constants)[nodes]
+                scale = step * numpy.maximum(numpy.abs(values), 1.0)
+
+                for j in range(self.candidates):
+                    constants = numpy.frombuffer(tree.constants).copy()
+                    constants[nodes] += state.normal(0.0, scale)
+                    candidate = tree.copy()
+                    candidate.replaceConstants(
+                        array.array('d', constants.tostring()))
+                    candidates.append(candidate)
+
+            evaluator.evaluateIndividuals(candidates)
+
+            for k, elite in enumerate(elites):
+                position = elite[0]
+                best = min(candidates[k * self.candidates:
+                                      (k + 1) * self.candidates],
+                           key = evaluator.rankKey)
+
+                if evaluator.rankKey(best) < \
+                        evaluator.rankKey(individuals[position]):
+                    individuals[position] = best
+                    elite[2] *= 2
+                else:
+                    elite[2] /= 2
+
+        individuals.sort(key = evaluator.rankKey)
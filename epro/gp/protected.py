@@ -21,6 +21,13 @@
 
 import math
 
+import numpy
+
+# Functions whose arguments can be swapped without changing the
+# result. min and max are left out since the builtins are not
+# symmetric when one of the arguments is NaN
+COMMUTATIVE = frozenset(['add', 'mul'])
+
 class GPFunction:
 
     @staticmethod
@@ -82,7 +89,7 @@ class GPFunction:
     @staticmethod
     def exp(x):
         try:
-            return math.tan(x)
+            return math.exp(x)
         except (ValueError, OverflowError):
             return 1.0
 
@@ -127,3 +134,115 @@ class GPFunction:
             return max(x, y)
         except (ValueError, OverflowError):
             return 1.0
+
+"""
+Array counterpart of GPFunction. Every function takes its arguments
+as arrays (or floats, which are broadcast) and writes the result into
+the preallocated out array, which may alias the first argument but
+never the second one. Positions where the scalar version would catch
+an exception get the same fallback value. Callers are expected to
+silence numpy floating point warnings, see numpy.errstate
+"""
+class ArrayGPFunction:
+
+    @staticmethod
+    def add(x, y, out):
+        return numpy.add(x, y, out)
+
+    @staticmethod
+    def sub(x, y, out):
+        return numpy.subtract(x, y, out)
+
+    @staticmethod
+    def mul(x, y, out):
+        return numpy.multiply(x, y, out)
+
+    @staticmethod
+    def div(x, y, out):
+        zero = (y == 0)
+        numpy.divide(x, y, out)
+        numpy.copyto(out, 1.0, where=zero)
+        return out
+
+    @staticmethod
+    def pow(x, y, out):
+        # Python raises for zero to a negative finite power, for
+        # negative numbers to a fractional power and when a finite
+        # result does not fit in a float
+        finite = numpy.isfinite(x) & numpy.isfinite(y)
+        invalid = finite & (((x == 0) & (y < 0)) |
+                            ((x < 0) & (y != numpy.floor(y))))
+        numpy.power(x, y, out)
+        invalid |= finite & ~numpy.isfinite(out)
+        numpy.copyto(out, 1.0, where=invalid)
+        return out
+
+    @staticmethod
+    def sqrt(x, out):
+        numpy.fabs(x, out)
+        return numpy.sqrt(out, out)
+
+    @staticmethod
+    def log(x, out):
+        zero = (x == 0)
+        numpy.fabs(x, out)
+        numpy.log(out, out)
+        numpy.copyto(out, 1.0, where=zero)
+        return out
+
+    @staticmethod
+    def log10(x, out):
+        zero = (x == 0)
+        numpy.fabs(x, out)
+        numpy.log10(out, out)
+        numpy.copyto(out, 1.0, where=zero)
+        return out
+
+    @staticmethod
+    def exp(x, out):
+        # Python raises when a finite argument overflows
+        finite = numpy.isfinite(x)
+        numpy.exp(x, out)
+        numpy.copyto(out, 1.0, where=finite & numpy.isinf(out))
+        return out
+
+    @staticmethod
+    def sin(x, out):
+        infinite = numpy.isinf(x)
+        numpy.sin(x, out)
+        numpy.copyto(out, 1.0, where=infinite)
+        return out
+
+    @staticmethod
+    def cos(x, out):
+        infinite = numpy.isinf(x)
+        numpy.cos(x, out)
+        numpy.copyto(out, 1.0, where=infinite)
+        return out
+
+    @staticmethod
+    def tan(x, out):
+        infinite = numpy.isinf(x)
+        numpy.tan(x, out)
+        numpy.copyto(out, 1.0, where=infinite)
+        return out
+
+    @staticmethod
+    def abs(x, out):
+        return numpy.absolute(x, out)
+
+    # The builtins return the first argument unless the second one
+    # compares strictly smaller (larger), which matters for NaN
+    @staticmethod
+    def min(x, y, out):
+        smaller = (y < x)
+        numpy.copyto(out, x)
+        numpy.copyto(out, y, where=smaller)
+        return out
+
+    @staticmethod
+    def max(x, y, out):
+        larger = (y > x)
+        numpy.copyto(out, x)
+        numpy.copyto(out, y, where=larger)
+        return out
@@ -0,0 +1,131 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+import numpy
+import random
+
+"""
+Parent selection schemes. Populations are ranked before selection,
+so the rank of an individual is its index and the better of two
+individuals is the one with the lower index. Schemes draw the indices
+of many parents in one pass
+"""
+class AbstractSelection:
+
+    """
+    Returns count indices of parents in a ranked population of the
+    given size, drawn with the numpy.random.RandomState state
+    """
+    def draw(self, size, count, state):
+        pass
+
+"""
+K tournament. The winner is the best of k individuals drawn
+uniformly
+"""
+class TournamentSelection(AbstractSelection):
+    def __init__(self, k=2):
+        self.k = k
+
+    def draw(self, size, count, state):
+        return state.randint(0, size, (count, self.k)).min(axis=1)
+
+"""
+K tournament with greedy overselection. With probability p_top the
+tournament is held among the best fraction of the population, and
+otherwise among the rest of it
+"""
+class GreedyOverselection(AbstractSelection):
+    def __init__(self, fraction=0.32, p_top=0.8, k=2):
+        self.fraction = fraction
+        self.p_top = p_top
+        self.k = k
+
+    def draw(self, size, count, state):
+        boundary = min(max(int(self.fraction * size), 1), size)
+
+        top = state.random_sample(count) < self.p_top
+        if boundary == size:
+            top[:] = True
+
+        low = numpy.where(top, 0, boundary)
+        high = numpy.where(top, boundary, size)
+
+        # Tournaments within [low, high)
+        offsets = state.random_sample((count, self.k)) * \
+            (high - low)[:, numpy.newaxis]
+        return low + offsets.astype(int).min(axis=1)
+
+"""
+Linear ranking. The best individual is selected pressure times as
+often as the median one, and the worst 2 - pressure times, with a
+pressure between 1 and 2
+"""
+class RankSelection(AbstractSelection):
+    def __init__(self, pressure=1.8):
+        self.pressure = pressure
+        # Cumulative probabilities by population size
+        self.cdfs = {}
+
+    def cdf(self, size):
+        cdf = self.cdfs.get(size)
+
+        if cdf is None:
+            ranks = numpy.arange(size - 1, -1, -1, dtype=float)
+            weights = (2 - self.pressure) + \
+                2 * (self.pressure - 1) * ranks / max(size - 1, 1)
+            cdf = numpy.cumsum(weights)
+            cdf /= cdf[-1]
+            self.cdfs[size] = cdf
+
+        return cdf
+
+    def draw(self, size, count, state):
+        indices = numpy.searchsorted(self.cdf(size),
+                                     state.random_sample(count),
+                                     side='right')
+        return numpy.minimum(indices, size - 1)
+
+"""
+Parents of the next generation of a ranked population. Indices are
+drawn batch_size at a time. The generator of each batch is seeded
+from the random module, so runs restored from a checkpoint select
+the same parents
+"""
+class Parents:
+    def __init__(self, individuals, selection, batch_size=None):
+        self.individuals = individuals
+        self.selection = selection
+        self.batch_size = batch_size or len(individuals) + 1
+        self.indices = []
+        self.position = 0
+
+    def next(self):
+        if self.position == len(self.indices):
+            state = numpy.random.RandomState(random.getrandbits(32))
+            self.indices = self.selection.draw(len(self.individuals),
+                                               self.batch_size,
+                                               state).tolist()
+            self.position = 0
+
+        individual = self.individuals[self.indices[self.position]]
+        self.position += 1
+        return individual
@@ -0,0 +1,143 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+import array
+import hashlib
+import struct
+
+import numpy
+
+import epro.gp.core
+import epro.gp.tree
+
+"""
+Compact binary encoding of trees. A list of trees is encoded as a
+header followed by, for every tree, its size, maximum height and
+fitness, and then by the opcodes of all their nodes in pre-order and
+the values of their CONSTANT nodes. Arities are implied by the
+opcodes. Everything is little endian. The header has a digest of the
+table of symbols, so trees are never decoded with other symbols
+"""
+
+MAGIC = 'EPROTRE1'
+HEADER = struct.Struct('<8s8sIII')
+DIGEST_SIZE = 8
+
+def symbolsDigest(parameters):
+    return hashlib.sha1(repr(parameters.symbols)).digest()[:DIGEST_SIZE]
+
+"""
+Returns the trees encoded as a string. They must be made of the
+symbols of parameters. Fitness is kept, but not the hash
+"""
+def encodeTrees(trees, parameters):
+    opcodes = array.array('h')
+    constants = array.array('d')
+    for tree in trees:
+        opcodes.extend(tree.opcodes)
+        constants.extend(tree.constants)
+
+    opcodes = numpy.frombuffer(opcodes, numpy.int16)
+    pool = numpy.frombuffer(constants, numpy.float64)[
+        opcodes == epro.gp.tree.CONSTANT]
+
+    # NaN stands for no fitness
+    fitness = [float('nan') if tree.fitness is None else tree.fitness
+               for tree in trees]
+    bounded = [isinstance(tree.fitness, epro.gp.core.FitnessBound)
+               for tree in trees]
+
+    return ''.join([
+        HEADER.pack(MAGIC, symbolsDigest(parameters), len(trees),
+                    len(opcodes), len(pool)),
+        numpy.array([len(tree) for tree in trees], '<u4').tostring(),
+        numpy.array([tree.max_height for tree in trees], '<u2').tostring(),
+        numpy.array(fitness, '<f8').tostring(),
+        numpy.array(bounded, '<u1').tostring(),
+        opcodes.astype('<i2').tostring(),
+        pool.astype('<f8').tostring()])
+
+"""
+Returns the trees encoded by encodeTrees. Raises ValueError if they
+were not made of the symbols of parameters
+"""
+def decodeTrees(encoded, parameters):
+    magic, digest, count, nodes, constants = \
+        HEADER.unpack_from(encoded)
+
+    if magic != MAGIC:
+        raise ValueError("Not an encoding of trees")
+    if digest != symbolsDigest(parameters):
+        raise ValueError("Trees were encoded with other symbols")
+
+    reader = Reader(encoded, HEADER.size)
+    sizes = reader.read('<u4', count)
+    max_heights = reader.read('<u2', count)
+    fitness = reader.read('<f8', count)
+    bounded = reader.read('<u1', count)
+    codes = reader.read('<i2', nodes).astype(numpy.int16)
+    pool = reader.read('<f8', constants)
+
+    # Arity of each opcode, shifted by one for CONSTANT
+    table = numpy.array([0] + [arity for symbol, arity in
+                               parameters.symbols], numpy.uint8)
+    values = numpy.zeros(nodes)
+    values[codes == epro.gp.tree.CONSTANT] = pool
+
+    opcodes = array.array('h', codes.tostring())
+    arities = array.array('B', table[codes.astype(numpy.intp) + 1].tostring())
+    values = array.array('d', values.tostring())
+
+    trees = []
+    start = 0
+
+    for i in xrange(count):
+        stop = start + int(sizes[i])
+        tree = epro.gp.tree.Tree(parameters, int(max_heights[i]))
+        tree.setNodes(opcodes[start:stop], arities[start:stop],
+                      values[start:stop])
+
+        if bounded[i]:
+            tree.fitness = epro.gp.core.FitnessBound(fitness[i])
+        elif not numpy.isnan(fitness[i]):
+            tree.fitness = float(fitness[i])
+
+        trees.append(tree)
+        start = stop
+
+    return trees
+
+"""
+Reads consecutive arrays from a string
+"""
+class Reader:
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+
+    def read(self, dtype, count):
+        dtype = numpy.dtype(dtype)
+        if not count:
+            return numpy.empty(0, dtype)
+
+        values = numpy.frombuffer(self.data, dtype, count, self.offset)
+        self.offset += dtype.itemsize * count
+        return values
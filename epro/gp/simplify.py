@@ -0,0 +1,164 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+import array
+import math
+
+import numpy
+
+import epro.gp.protected
+import epro.gp.tree
+
+"""
+Algebraic simplification. Subtrees of constants are folded and
+identities are removed, but only where the simplified tree computes
+exactly the same output for every record, including the fallback
+values of the protected functions, infinities and NaN. Returns a new
+tree, or the same tree if nothing could be simplified. Constants are
+folded with the array functions used to evaluate the tree. Variables
+in finite are known to be finite in every record
+"""
+def simplify(tree, finite=frozenset(),
+             functions=epro.gp.protected.ArrayGPFunction):
+    symbols = tree.parameters.symbols
+    # Nodes of the simplified subtrees following the current node,
+    # as lists of opcodes, arities and constants in pre-order
+    stack = []
+    changed = False
+
+    for i in reversed(xrange(len(tree.opcodes))):
+        arity = tree.arities[i]
+        node = ([tree.opcodes[i]], [arity], [tree.constants[i]])
+
+        if not arity:
+            stack.append(node)
+            continue
+
+        arguments = [stack.pop() for j in range(arity)]
+        simplified = simplifyNode(tree.opcodes[i], arguments, symbols,
+                                  finite, functions)
+
+        if simplified is None:
+            for opcodes, arities, constants in arguments:
+                node[0].extend(opcodes)
+                node[1].extend(arities)
+                node[2].extend(constants)
+        else:
+            node = simplified
+            changed = True
+
+        stack.append(node)
+
+    if not changed:
+        return tree
+
+    opcodes, arities, constants = stack[0]
+    simplified = epro.gp.tree.Tree(tree.parameters, tree.max_height)
+    simplified.setNodes(array.array('h', opcodes), array.array('B', arities),
+                        array.array('d', constants))
+    simplified.fitness = tree.fitness
+
+    return simplified
+
+# Functions that take the absolute value of their argument anyway
+ABSOLUTE = frozenset(['abs', 'sqrt', 'log', 'log10'])
+
+"""
+Returns the simplified nodes of the function with the opcode applied
+to the simplified arguments, or None if it cannot be simplified
+"""
+def simplifyNode(opcode, arguments, symbols, finite, functions):
+    name = symbols[opcode][0]
+
+    if all([isConstant(argument) for argument in arguments]):
+        value = fold(getattr(functions, name),
+                     [argument[2][0] for argument in arguments])
+        # Infinities and NaN are left for the evaluation to produce
+        if math.isinf(value) or math.isnan(value):
+            return None
+        return constant(value)
+
+    if len(arguments) == 1:
+        x = arguments[0]
+
+        # abs(abs(e)), sqrt(abs(e)), log(abs(e)) and log10(abs(e))
+        if name in ABSOLUTE and rootName(x, symbols) == 'abs':
+            return ([opcode] + x[0][1:], x[1], x[2])
+        # abs(sqrt(e)). NaN keeps being NaN
+        if name == 'abs' and rootName(x, symbols) == 'sqrt':
+            return x
+        return None
+
+    if len(arguments) != 2:
+        return None
+
+    x, y = arguments
+
+    # mul(e, 1), mul(1, e), div(e, 1) and pow(e, 1)
+    if name in ('mul', 'div', 'pow') and isValue(y, 1.0):
+        return x
+    if name == 'mul' and isValue(x, 1.0):
+        return y
+    # pow(e, 0) is 1 even for infinities and NaN
+    if name == 'pow' and isValue(y, 0.0):
+        return constant(1.0)
+    # sub(e, 0) only for a positive zero, which keeps negative zeros
+    if name == 'sub' and isValue(y, 0.0) and math.copysign(1.0, y[2][0]) > 0:
+        return x
+
+    if x != y:
+        return None
+
+    # min(e, e) and max(e, e) return their first argument
+    if name in ('min', 'max'):
+        return x
+    # sub(x, x) and div(x, x) of a variable that is always finite.
+    # Division by zero is protected and gives 1 as well
+    if len(x[0]) == 1 and symbols[x[0][0]][0] in finite:
+        if name == 'sub':
+            return constant(0.0)
+        if name == 'div':
+            return constant(1.0)
+
+    return None
+
+def isConstant(nodes):
+    return nodes[0][0] == epro.gp.tree.CONSTANT
+
+def isValue(nodes, value):
+    return isConstant(nodes) and nodes[2][0] == value
+
+def constant(value):
+    return ([epro.gp.tree.CONSTANT], [0], [value])
+
+# Name of the function at the root of the nodes, if any
+def rootName(nodes, symbols):
+    if not nodes[1][0]:
+        return None
+    return symbols[nodes[0][0]][0]
+
+# Value of the function on constant arguments, computed as it would
+# be during evaluation
+def fold(function, values):
+    out = numpy.empty(1)
+    with numpy.errstate(all='ignore'):
+        function(*(values + [out]))
+    return float(out[0])
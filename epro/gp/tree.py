@@ -19,140 +19,254 @@
 #
 #========================================================================
 
+import array
+import hashlib
 import random
-import string
+
+import epro.gp.protected
+
+# Opcode of the terminal nodes holding a random number
+CONSTANT = -1
+
+class TreeInitParameters:
+    def __init__(self, terminal_set, internal_set,
+                 p_rand = 0.0, rand_bounds = (-1.0, 1.0)):
+        self.terminal_set = terminal_set # List of terminal symbols
+        self.internal_set = internal_set # List of functions
+        self.p_rand = p_rand             # Prob of node to be random number
+        self.rand_bounds = rand_bounds   # Bounds for those random numbers
+
+        # Table of symbols. The opcode of a node is its index in this
+        # table, terminal symbols come first and have arity zero
+        self.symbols = ([(terminal, 0) for terminal in terminal_set] +
+                        list(internal_set))
+        self.terminal_codes = range(len(terminal_set))
+        self.internal_codes = range(len(terminal_set), len(self.symbols))
 
 """
-Tree node
+Syntactic tree. Nodes are stored in pre-order as three parallel
+arrays: the opcode, the arity and the constant value (only meaningful
+for CONSTANT nodes) of every node. A node is referred to by its
+position in those arrays, and the subtree rooted at a node spans
+the positions up to subtreeEnd(node).
+The size and height of the subtree rooted at every node, as well as
+the depth of every node, are kept in three more arrays. They are
+updated along with the nodes.
+The arrays of a tree are never modified once built. Modifying a tree
+replaces them, so copies can share them with the original
 """
-class TreeNode:
-    def __init__(self):
-        self.children = []
-        self.parent = self
+class Tree(object):
+    __slots__ = ('parameters', 'fitness', 'max_height',
+                 'opcodes', 'arities', 'constants', 'key',
+                 'sizes', 'heights', 'depths')
 
-    """
-    Returns height of tree for which this node is root
-    """
-    def height(self):
-        if(not self.children):
-            return 0
-        
-        # If node is internal its height is the maximum height
-        # among its subtrees plus one
-        return max([subtree.height()
-                    for subtree in self.children]) + 1
+    def __init__(self, parameters, max_height=30, init_depth=-1, p_full=0.0):
+        self.parameters = parameters
+        self.fitness = None
+        self.max_height = max_height
+        self.setNodes(array.array('h'), array.array('B'), array.array('d'))
+
+        # The default parameter creates an empty tree
+        if init_depth >= 0:
+            tree = self.randomInit(init_depth, p_full)
+            self.setNodes(tree.opcodes, tree.arities, tree.constants)
 
     """
-    Returns the depth of this node
+    String representation of the tree is a python expression
+    ready to be evaluated
     """
-    def depth(self):
-        depth = 0
-        node = self
+    def __str__(self):
+        symbols = self.parameters.symbols
+        stack = []
+
+        # In reversed pre-order the arguments of a function are
+        # on top of the stack, leftmost first
+        for i in reversed(xrange(len(self.opcodes))):
+            opcode = self.opcodes[i]
+
+            if opcode == CONSTANT:
+                stack.append(str(self.constants[i]))
+            elif not self.arities[i]:
+                stack.append(symbols[opcode][0])
+            else:
+                arguments = [stack.pop() for j in range(self.arities[i])]
+                stack.append("%s(%s)" % (symbols[opcode][0],
+                                         ",".join(arguments)))
+
+        return stack[0]
+
+    def __len__(self):
+        return len(self.opcodes)
 
-        while(not node.parent is node):
-            node = node.parent
-            depth = depth + 1
+    # Trees are pickled as raw arrays, which is what the process
+    # pools send to their workers
+    def __getstate__(self):
+        return (self.parameters, self.fitness, self.max_height,
+                self.opcodes.tostring(), self.arities.tostring(),
+                self.constants.tostring(), self.key)
+
+    def __setstate__(self, state):
+        (self.parameters, self.fitness, self.max_height,
+         opcodes, arities, constants, key) = state
+        self.setNodes(array.array('h', opcodes), array.array('B', arities),
+                      array.array('d', constants))
+        self.key = key
+
+    def setNodes(self, opcodes, arities, constants):
+        self.opcodes = opcodes
+        self.arities = arities
+        self.constants = constants
+        self.key = None
+        self.updateMetadata()
 
-        return depth
-    
     """
-    Pre-order traversal for the tree for which this node is root
+    Computes sizes, heights and depths from the arities
     """
-    def preTraversal(self):
-        order = [self]
+    def updateMetadata(self):
+        count = len(self.arities)
+        sizes = [1] * count
+        heights = [0] * count
+        depths = [0] * count
+        # Size and height of the subtrees following the current node
+        stack = []
 
-        for child in self.children:
-            order += child.preTraversal()
+        for i in reversed(xrange(count)):
+            arity = self.arities[i]
 
-        return order
+            if arity:
+                children = stack[-arity:]
+                del stack[-arity:]
+                sizes[i] += sum([size for size, height in children])
+                heights[i] = max([height for size, height in children]) + 1
+            stack.append((sizes[i], heights[i]))
 
-"""
-Function node
-"""
-class FunctionNode(TreeNode):
-    def __init__(self, function, children):
-        TreeNode.__init__(self)
-        self.function = function
-        self.setChildren(children)
+        # Depth of the nodes still expecting children
+        pending = []
+
+        for i in xrange(count):
+            if pending:
+                depths[i] = pending.pop() + 1
+            pending.extend([depths[i]] * self.arities[i])
+
+        self.sizes = array.array('I', sizes)
+        self.heights = array.array('H', heights)
+        self.depths = array.array('H', depths)
 
     """
-    String representation of the internal node is a python expression
-    ready to be evaluated
+    Returns a copy of the tree. Both trees share the parameters and
+    the arrays until one of them is modified
     """
-    def __str__(self):
-        function_name = self.function[0]
-        arguments = [str(child) for child in self.children]
+    def copy(self):
+        tree = Tree(self.parameters, self.max_height)
+        tree.fitness = self.fitness
+        tree.opcodes = self.opcodes
+        tree.arities = self.arities
+        tree.constants = self.constants
+        tree.sizes = self.sizes
+        tree.heights = self.heights
+        tree.depths = self.depths
+        tree.key = self.key
 
-        return (function_name + "(%s)") % string.join(arguments, ",")
+        return tree
 
     """
-    Set children of this node
+    Replaces the values of the CONSTANT nodes, given as an array with
+    one value per node
     """
-    def setChildren(self, children):
-        self.children = children
+    def replaceConstants(self, constants):
+        self.constants = constants
+        self.fitness = None
+        self.key = None
 
-        # Keep a reference to parent
-        for child in self.children:
-            child.parent = self
+    """
+    Returns a hash of the structure of the tree. Trees computing the
+    same expression up to the order of the arguments of commutative
+    functions have the same hash. It is remembered until the tree is
+    modified
+    """
+    def canonicalHash(self):
+        if self.key is None:
+            self.key = hashlib.sha1(self.canonicalForm()).digest()
 
-"""
-Terminal node
-"""
-class TerminalNode(TreeNode):
-    def __init__(self, value):
-        TreeNode.__init__(self)
-        self.value = value
+        return self.key
 
     """
-    The terminal node value should be a string already
+    Returns a string encoding the tree where the arguments of
+    commutative functions are sorted
     """
-    def __str__(self):
-        return self.value
+    def canonicalForm(self):
+        symbols = self.parameters.symbols
+        commutative = epro.gp.protected.COMMUTATIVE
+        stack = []
 
-    def evaluate(self):
-        return self.value
+        for i in reversed(xrange(len(self.opcodes))):
+            opcode = self.opcodes[i]
 
-class TreeInitParameters:
-    def __init__(self, terminal_set, internal_set,
-                 p_rand = 0.0, rand_bounds = (-1.0, 1.0)):
-        self.terminal_set = terminal_set # List of terminal symbols
-        self.internal_set = internal_set # List of functions
-        self.p_rand = p_rand             # Prob of node to be random number
-        self.rand_bounds = rand_bounds   # Bounds for those random numbers
+            if opcode == CONSTANT:
+                stack.append(repr(self.constants[i]))
+            elif not self.arities[i]:
+                stack.append(str(opcode))
+            else:
+                arguments = [stack.pop() for j in range(self.arities[i])]
+                if symbols[opcode][0] in commutative:
+                    arguments.sort()
+                stack.append("%d(%s)" % (opcode, ",".join(arguments)))
 
-"""
-Syntactic tree
-"""
-class Tree:
-    def __init__(self, parameters, max_height=30, init_depth=-1, p_full=0.0):
-        self.root = None
-        self.parameters = parameters
-        self.fitness = None
-        self.max_height = max_height
+        return stack[0]
 
-        # The default parameter creates an empty tree
-        if init_depth >= 0:
-            self.root = self.randomInit(init_depth, p_full).root
+    """
+    Returns the position following the last node of the subtree
+    rooted at node
+    """
+    def subtreeEnd(self, node):
+        return node + self.sizes[node]
 
-    def __str__(self):
-        return str(self.root)
+    """
+    Returns the subtree rooted at node as a new tree
+    """
+    def subtree(self, node):
+        end = self.subtreeEnd(node)
+        depth = self.depths[node]
+        tree = Tree(self.parameters, self.max_height)
+        tree.opcodes = self.opcodes[node:end]
+        tree.arities = self.arities[node:end]
+        tree.constants = self.constants[node:end]
+        tree.sizes = self.sizes[node:end]
+        tree.heights = self.heights[node:end]
+        tree.depths = array.array('H', [d - depth
+                                        for d in self.depths[node:end]])
+
+        return tree
 
     """
-    Compiling the expression before evaluation over the data set
-    for efficiency
+    Returns height of the subtree rooted at node, the whole tree
+    by default
     """
-    def getCompiledCode(self):
-        try:
-            return compile(str(self), '<string>', 'eval')
-        except MemoryError:
-            print "Warning: bloated tree. Depth %d" % self.height()
-            return str(float('inf'))
+    def height(self, node=0):
+        return self.heights[node]
 
     """
-    Returns depth of the tree
+    Returns the depth of node
     """
-    def height(self):
-        return self.root.height()
+    def depth(self, node):
+        return self.depths[node]
+
+    """
+    Returns the positions of the ancestors of node, root first
+    """
+    def ancestors(self, node):
+        path = []
+        parent = 0
+
+        while parent != node:
+            path.append(parent)
+            # Skip the children to the left of the one containing node
+            child = parent + 1
+            while child + self.sizes[child] <= node:
+                child += self.sizes[child]
+            parent = child
+
+        return path
 
     """
     Returns a random tree with a maximum depth. It uses the same
@@ -168,36 +282,47 @@ class Tree:
         # This function os meant to be called from outside the
         # class to generate random trees with the same properties
         # as this tree. This is for avoiding generating larger trees
-        max_height = min(max_height, self.max_height)
+        self.randomNodes(tree, min(max_height, self.max_height), p_full)
+        tree.updateMetadata()
+
+        return tree
+
+    # Appends to tree the nodes of a random subtree in pre-order
+    def randomNodes(self, tree, max_height, p_full):
+        parameters = self.parameters
 
         # Node is at maximum height so it has to be terminal
         if max_height == 0:
-            terminal_set = self.parameters.terminal_set
-            
             # Random numbers are allowed as terminals with a certain
             # probability
-            if random.random() < self.parameters.p_rand:
-                terminal = random.uniform(*self.parameters.rand_bounds)
+            if random.random() < parameters.p_rand:
+                opcode = CONSTANT
+                constant = random.uniform(*parameters.rand_bounds)
             else:
                 # Randomly pick the terminal symbol
-                terminal = random.choice(terminal_set)
-            
-            tree.root = TerminalNode(str(terminal))
+                opcode = random.choice(parameters.terminal_codes)
+                constant = 0.0
+
+            tree.opcodes.append(opcode)
+            tree.arities.append(0)
+            tree.constants.append(constant)
         else:
             # Randomly pick the function
-            function = random.choice(self.parameters.internal_set)
-            arity = function[1]
+            opcode = random.choice(parameters.internal_codes)
+            arity = parameters.symbols[opcode][1]
             # Pick the depth of subtrees according to initialization
             # method
             next_heights = [max_height - 1 if random.random() < p_full else 0
                            for i in range(arity)]
-            # Create children
-            children = [self.randomInit(next_heights[i], p_full).root
-                        for i in range(len(next_heights))]
 
-            tree.root = FunctionNode(function, children)
+            tree.opcodes.append(opcode)
+            tree.arities.append(arity)
+            tree.constants.append(0.0)
 
-        return tree
+            # Create children
+            for next_height in next_heights:
+                self.randomNodes(tree, min(next_height, self.max_height),
+                                 p_full)
 
     """
     Picks a random node (uniformly) which is root of a subtree
@@ -205,27 +330,55 @@ class Tree:
     than max_height
     """
     def randomNode(self, max_depth=30, max_height=30):
-        # Get list of nodes with labeled heights
-        nodes = self.root.preTraversal()
+        # Every node complies
+        if max_depth >= self.heights[0] and max_height >= self.heights[0]:
+            return random.randrange(len(self.opcodes))
+
         # Pick nodes complying with depth restriction
-        valid_nodes = [node for node in nodes
-                       if (node.depth() <= max_depth and \
-                               node.height() <= max_height)]
+        valid_nodes = [node for node, depth, height
+                       in zip(xrange(len(self.opcodes)),
+                              self.depths, self.heights)
+                       if depth <= max_depth and height <= max_height]
 
         try:
             return random.choice(valid_nodes)
         except IndexError:
             print max_depth
-            print len(nodes)
+            print len(self.opcodes)
             print len(valid_nodes)
 
-    # Substitute a node within the tree
-    def substituteNode(self, old_node, new_node):
-        # If the node is the root
-        if old_node.parent is self.root:
-            self.root = new_node
-            new_node.parent = new_node
-        else:
-            siblings = old_node.parent.children
-            siblings[siblings.index(old_node)] = new_node
-            new_node.parent = old_node.parent
+    """
+    Substitute the subtree rooted at node for another tree. New arrays
+    are built from the nodes before and after the subtree, and those
+    of the other tree. Only the metadata of the new nodes and of the
+    ancestors of node change
+    """
+    def substituteNode(self, node, tree):
+        end = self.subtreeEnd(node)
+        depth = self.depths[node]
+        growth = len(tree.opcodes) - (end - node)
+        path = self.ancestors(node)
+
+        self.opcodes = self.opcodes[:node] + tree.opcodes + \
+            self.opcodes[end:]
+        self.arities = self.arities[:node] + tree.arities + \
+            self.arities[end:]
+        self.constants = self.constants[:node] + tree.constants + \
+            self.constants[end:]
+        self.sizes = self.sizes[:node] + tree.sizes + self.sizes[end:]
+        self.heights = self.heights[:node] + tree.heights + \
+            self.heights[end:]
+        self.depths = self.depths[:node] + \
+            array.array('H', [d + depth for d in tree.depths]) + \
+            self.depths[end:]
+        self.key = None
+
+        # Ancestors change size and maybe height, deepest first
+        for parent in reversed(path):
+            self.sizes[parent] += growth
+            height = 0
+            child = parent + 1
+            for i in range(self.arities[parent]):
+                height = max(height, self.heights[child])
+                child += self.sizes[child]
+            self.heights[parent] = height + 1
@@ -19,16 +19,147 @@
 #
 #========================================================================
 
-import string
+import json
+import os
+import struct
+
+import numpy
 
 class CSVDataSet:
 
     def __init__(self, filename):
-        with open(filename, 'r') as f:
-            text = f.read()
+        # The first line is the header with the names of the columns
+        with open(filename, 'rU') as f:
+            self.names = f.readline().strip().split(',')
+
+        # Records are kept column-major, so every column is a
+        # contiguous array
+        self.data = numpy.asfortranarray(
+            numpy.loadtxt(filename, delimiter=',', skiprows=1, ndmin=2))
+
+    def column(self, name):
+        return self.data[:, self.names.index(name)]
+
+# Binary column files start with this string, followed by the length
+# of a JSON header and the header itself. Columns of float64 values
+# come next, one after the other, aligned to eight bytes
+COLUMNS_MAGIC = 'EPROCOL1'
+
+"""
+Data set read from a binary column file. The file is created from
+a CSV file with a header the first time, and memory mapped after
+that, so columns are loaded on demand and never copied. The binary
+file records the size and modification time of the CSV file it was
+built from, and is rebuilt whenever either of them changes, even if
+the CSV file was replaced by an older one
+"""
+class ColumnDataSet:
+
+    def __init__(self, filename, columns_filename=None):
+        if columns_filename is None:
+            columns_filename = filename + '.cols'
+
+        if not os.path.exists(columns_filename) or \
+                readHeader(columns_filename).get('source') != \
+                sourceStamp(filename):
+            convertCSV(filename, columns_filename)
+
+        self.names, self.data = readColumns(columns_filename)
+
+    def column(self, name):
+        return self.data[:, self.names.index(name)]
+
+"""
+Maps a binary column file. Returns the names of the columns and a
+read only, column-major array with the records
+"""
+def readColumns(filename):
+    header = readHeader(filename)
+    length = header['length']
+    names = [str(name) for name in header['names']]
+    shape = (header['rows'], len(names))
+
+    # Empty files cannot be mapped
+    if not shape[0]:
+        return names, numpy.empty(shape, order='F')
+
+    data = numpy.memmap(filename, dtype='<f8', mode='r',
+                        offset=columnsOffset(length), shape=shape,
+                        order='F')
+
+    return names, data
+
+"""
+Returns the JSON header of a binary column file, with the length it
+takes in the file under 'length'
+"""
+def readHeader(filename):
+    with open(filename, 'rb') as f:
+        if f.read(len(COLUMNS_MAGIC)) != COLUMNS_MAGIC:
+            raise ValueError("%s is not a column file" % filename)
+        length = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(length))
+
+    header['length'] = length
+    return header
+
+# Size and modification time of a file, which tell whether the column
+# file built from it is up to date
+def sourceStamp(filename):
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+def columnsOffset(header_length):
+    offset = len(COLUMNS_MAGIC) + 8 + header_length
+    return offset + (-offset % 8)
+
+"""
+Writes the records of a CSV file, whose first line is the header,
+as a binary column file. The CSV file is read twice, first to count
+the records and then chunk_size records at a time, so it does not
+need to fit in memory. The column file is replaced atomically
+"""
+def convertCSV(filename, columns_filename, chunk_size=65536):
+    # Taken first, so changes made while converting trigger a rebuild
+    source = sourceStamp(filename)
+
+    with open(filename, 'rU') as f:
+        names = f.readline().strip().split(',')
+        rows = sum(1 for line in f if line.strip())
+
+    header = json.dumps({'names': names, 'rows': rows, 'source': source})
+    offset = columnsOffset(len(header))
+    temporary = columns_filename + '.tmp'
+
+    with open(temporary, 'wb') as f:
+        f.write(COLUMNS_MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        f.write('\0' * (offset - f.tell()))
+        f.truncate(offset + 8 * rows * len(names))
+
+    if rows:
+        data = numpy.memmap(temporary, dtype='<f8', mode='r+',
+                            offset=offset, shape=(rows, len(names)),
+                            order='F')
+
+        with open(filename, 'rU') as f:
+            f.readline()
+            row = 0
+            chunk = []
+
+            for line in f:
+                if line.strip():
+                    chunk.append(line.split(','))
+                if len(chunk) == chunk_size:
+                    data[row:row + len(chunk)] = numpy.array(chunk, float)
+                    row += len(chunk)
+                    chunk = []
+
+            if chunk:
+                data[row:row + len(chunk)] = numpy.array(chunk, float)
 
-        lines = string.split(text, '\r\n')
+        data.flush()
+        del data
 
-        # Ignore first and last line
-        self.data = [[float(item) for item in string.split(record, ',')]
-                      for record in lines[1:-1]]
+    os.rename(temporary, columns_filename)
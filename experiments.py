@@ -0,0 +1,189 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+"""
+Runs regression.py over a grid of data sets, seeds and settings, on a
+pool of processes. Every finished run is appended to a table of tab
+separated values, and runs already in the table are skipped, so an
+interrupted experiment can be resumed. A summary by data set and
+settings is printed at the end
+"""
+
+import argparse
+import ast
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy
+
+import regression
+import settings
+import epro.gp.util
+
+DATA_SETS = ['data/TrainingSet.csv:data/TestingSet.csv',
+             'data/TrainingSet2.csv:data/TestingSet2.csv',
+             'data/TrainingSet3.csv:data/TestingSet3.csv']
+SEEDS = range(1, 31)
+COLUMNS = ['training_set', 'testing_set', 'settings', 'seed',
+           'training_error', 'testing_error', 'seconds', 'function']
+
+# Runs are processes of a pool, which cannot start processes of their
+# own, and must not write to the same files
+SERIAL = {'WORKERS': 1, 'ISLANDS': 1, 'ASYNCHRONOUS': False,
+          'METRICS': None}
+
+"""
+The settings module, with some of its values replaced
+"""
+class Settings:
+    def __init__(self, overrides):
+        self.overrides = overrides
+
+    def __getattr__(self, name):
+        if name in self.overrides:
+            return self.overrides[name]
+        return getattr(settings, name)
+
+# Settings given as NAME=VALUE pairs separated by commas, where values
+# are Python literals
+def parseSettings(text):
+    overrides = {}
+
+    for pair in filter(None, text.split(',')):
+        name, value = pair.split('=', 1)
+        overrides[name.strip()] = ast.literal_eval(value.strip())
+
+    overrides.update(SERIAL)
+    return overrides
+
+# Data sets by file name. They are read before the pool is started,
+# so that every run shares them
+data_sets = {}
+
+def runCell(cell):
+    training_set, testing_set, name, seed = cell
+    start = time.time()
+    result = regression.run(data_sets[training_set], data_sets[testing_set],
+                            seed, config=Settings(parseSettings(name)),
+                            verbose=False)
+
+    return cell, result, time.time() - start
+
+# Rows of the table by cell
+def readTable(filename):
+    rows = {}
+    if not os.path.exists(filename):
+        return rows
+
+    with open(filename) as f:
+        for line in f.readlines()[1:]:
+            row = dict(zip(COLUMNS, line.rstrip('\n').split('\t')))
+            row['seed'] = int(row['seed'])
+            for column in ['training_error', 'testing_error', 'seconds']:
+                row[column] = float(row[column])
+            rows[cellOf(row)] = row
+
+    return rows
+
+def cellOf(row):
+    return (row['training_set'], row['testing_set'], row['settings'],
+            row['seed'])
+
+"""
+Prints the errors and time of the runs of each data set and settings
+"""
+def summarize(cells, rows):
+    print "%-24s %-20s %4s %12s %12s %12s %8s" % (
+        'training set', 'settings', 'runs', 'median test', 'mean test',
+        'best test', 'seconds')
+
+    groups = []
+    for cell in cells:
+        if cell[:3] not in groups:
+            groups.append(cell[:3])
+
+    for group in groups:
+        done = [rows[cell] for cell in cells
+                if cell[:3] == group and cell in rows]
+        if not done:
+            continue
+
+        errors = numpy.array([row['testing_error'] for row in done])
+        seconds = numpy.mean([row['seconds'] for row in done])
+        print "%-24s %-20s %4d %12.6g %12.6g %12.6g %8.1f" % (
+            os.path.basename(group[0]), group[2] or '(default)', len(done),
+            numpy.median(errors), numpy.mean(errors), numpy.min(errors),
+            seconds)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('table', help='file of tab separated results')
+    parser.add_argument('--data', nargs='*', default=DATA_SETS,
+                        help='training_set:testing_set pairs')
+    parser.add_argument('--seeds', type=int, nargs='*', default=SEEDS)
+    parser.add_argument('--settings', nargs='*', default=[''],
+                        help='NAME=VALUE,... changes to settings.py')
+    parser.add_argument('--processes', type=int,
+                        default=multiprocessing.cpu_count())
+    arguments = parser.parse_args()
+
+    pairs = [pair.split(':') for pair in arguments.data]
+    cells = [(training_set, testing_set, name, seed)
+             for training_set, testing_set in pairs
+             for name in arguments.settings
+             for seed in arguments.seeds]
+
+    rows = readTable(arguments.table)
+    pending = [cell for cell in cells if cell not in rows]
+    print "%d runs, %d already done" % (len(cells), len(cells) - len(pending))
+
+    for training_set, testing_set in pairs:
+        for filename in [training_set, testing_set]:
+            if filename not in data_sets:
+                data_sets[filename] = epro.gp.util.ColumnDataSet(filename)
+
+    if not rows:
+        with open(arguments.table, 'w') as f:
+            f.write('\t'.join(COLUMNS) + '\n')
+
+    pool = multiprocessing.Pool(arguments.processes)
+
+    with open(arguments.table, 'a') as f:
+        for cell, result, seconds in pool.imap_unordered(runCell, pending):
+            row = dict(zip(COLUMNS[:4], cell), seconds=seconds, **result)
+            f.write('\t'.join([str(row[column]) if not
+                               isinstance(row[column], float)
+                               else repr(row[column])
+                               for column in COLUMNS]) + '\n')
+            f.flush()
+
+            rows[cell] = row
+            sys.stdout.write("%s seed %d: testing error %s\n" %
+                             (cell[2] or '(default)', cell[3],
+                              row['testing_error']))
+            sys.stdout.flush()
+
+    pool.close()
+    pool.join()
+
+    summarize(cells, rows)
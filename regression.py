@@ -20,75 +20,85 @@
 #========================================================================
 
 import math
+import os
 import sys
 import random
 
 import settings
 
+import epro.gp.archive
+import epro.gp.cache
+import epro.gp.checkpoint
 import epro.gp.core
-import epro.gp.protected
+import epro.gp.evaluation
+import epro.gp.instrument
+import epro.gp.island
+import epro.gp.optimize
 import epro.gp.tree
 import epro.gp.util
 import epro.gp.operator as gpop
 
 # This is the fitness function to be used to drive
-# evolution. It is the average of the sum of squared prediction
-# errors. The average is taken to make proper posterior
-# comparisons between training and testing errors, since
-# both data sets can have different sizes
-def fitness_function(tree, data_set):
-    tree_code = tree.getCompiledCode()
-    sse = 0
-
-    safe_function = epro.gp.protected.GPFunction
-
-    locals = {'add': safe_function.add,
-              'sub': safe_function.sub,
-              'mul': safe_function.mul,
-              'div': safe_function.div,
-              'pow': safe_function.pow,
-              'sqrt': safe_function.sqrt,
-              'log': safe_function.log,
-              'log10': safe_function.log10,
-              'sin': safe_function.sin,
-              'cos': safe_function.cos,
-              'tan': safe_function.tan,
-              'exp': safe_function.exp,
-              'min': safe_function.min,
-              'max': safe_function.max}
-
-    for item in data_set.data:
-        locals['x'] = item[0]
-        locals['y'] = item[1]
-        locals['z'] = item[2]
-        
-        # Training error is predicted - ground truth
-        training_error = eval(tree_code, {}, locals) - item[3]
-
-        try:
-            sse += (training_error ** 2)
-        except Exception:
-            return float('inf')
-
-    return 1.0 / sse
+# evolution. It is the sum of squared prediction errors,
+# so lower is better. The tree is evaluated over the whole
+# data set at once by an array evaluator. When racing,
+# evaluation stops once the error exceeds the bound
+def fitness_function(tree, evaluator, bound=None):
+    return evaluator.sse(tree, bound)
+
+# Same as above for a whole population. Records are streamed
+# in chunks, and every chunk is read once per generation
+def population_fitness_function(trees, evaluator, bound=None):
+    return evaluator.populationSSE(trees, bound)
+
+# Builds the array evaluator of a data set. Each terminal symbol
+# is bound to one column, and the ground truth follows them
+def array_evaluator(data_set, terminal_set, outputs=None, chunk_size=None,
+                    monitor=None, scaling=None):
+    variables = dict((name, data_set.data[:, i])
+                     for i, name in enumerate(terminal_set))
+    target = data_set.data[:, len(terminal_set)]
+
+    return epro.gp.evaluation.ArrayEvaluator(variables, target,
+                                             outputs=outputs,
+                                             chunk_size=chunk_size,
+                                             monitor=monitor,
+                                             scaling=scaling)
+
+# Size of the chunks the training set is evaluated in. Racing only
+# abandons evaluations between chunks, so unless CHUNK_SIZE is set
+# racing runs split the training set in RACING_CHUNKS chunks
+def training_chunk_size(data_set, config):
+    if config.CHUNK_SIZE is not None or config.RACING is None:
+        return config.CHUNK_SIZE
+
+    return -(-len(data_set.data) // config.RACING_CHUNKS)
 
 def usage():
-    print "Usage: regression.py training_set testing_set seed"
-
-if __name__ == '__main__':
-    if(len(sys.argv) != 4):
-        usage()
-        sys.exit(1)
-
-    training_set = epro.gp.util.CSVDataSet(sys.argv[1])
-    test_set = epro.gp.util.CSVDataSet(sys.argv[2])
-
-    random.seed(int(sys.argv[3])) # 23 very good
+    print "Usage: regression.py training_set testing_set seed [checkpoint]"
+
+"""
+Evolves a function fitting the training set, starting from the given
+seed. Settings are read from config, the settings module by default.
+If a checkpoint file is given the run is saved there, and resumed
+from it if it exists. Only generational runs with a single island
+can be checkpointed. Returns the errors per record of the best
+individual, the function it learnt, the training errors and sizes of
+the Pareto front and the hit rates of the caches
+"""
+def run(training_set, test_set, seed, checkpoint=None, config=settings,
+        verbose=True):
+    if checkpoint is not None and \
+            (config.ISLANDS > 1 or config.STEADY_STATE):
+        raise ValueError("Only generational runs with a single island "
+                         "can be checkpointed")
+
+    random.seed(seed) # 23 very good
 
     genetic_operator_set = gpop.GeneticOperatorSet(
         [gpop.GeneticReproduction(),
-         gpop.GeneticMutation(),
-         gpop.GeneticCrossover()],
+         gpop.GeneticMutation(max_size=config.MAX_SIZE),
+         gpop.GeneticCrossover(max_size=config.MAX_SIZE)],
         [20, 35, 45])
 
     terminal_set = ['x', 'y', 'z']
@@ -99,22 +109,127 @@ if __name__ == '__main__':
     parameters = epro.gp.tree.TreeInitParameters(terminal_set,
                                                  internal_set, 0.05)
 
-    print "Creating population..................."
-    population = epro.gp.core.GPPopulation(size=settings.POPULATION_SIZE,
-                                           tree_parameters=parameters,
-                                           max_depth=settings.MAX_HEIGHT,
-                                           init_depth=settings.INITIAL_DEPTH)
-    evaluator = epro.gp.core.GPEvaluator(fitness_function,
-                                         training_set, test_set)
+    if verbose:
+        print "Creating population..................."
+    populations = [epro.gp.core.GPPopulation(
+            size=config.POPULATION_SIZE,
+            tree_parameters=parameters,
+            max_depth=config.MAX_HEIGHT,
+            init_depth=config.INITIAL_DEPTH,
+            node_budget=config.NODE_BUDGET)
+                   for i in range(config.ISLANDS)]
+    outputs = epro.gp.cache.OutputCache(config.OUTPUT_CACHE_BYTES)
+    cache = epro.gp.cache.FitnessCache(config.FITNESS_CACHE_SIZE)
+
+    # Metrics of each generation are appended to this file
+    monitor = None
+    if config.METRICS is not None:
+        monitor = epro.gp.instrument.Instrumentation(
+            epro.gp.instrument.JSONLSink(config.METRICS))
+        monitor.watchCache('fitness', cache)
+        monitor.watchCache('outputs', outputs)
+
+    # With linear scaling trees are tested with the scaling fitted
+    # over the training set
+    training = array_evaluator(training_set, terminal_set, outputs,
+                               training_chunk_size(training_set, config),
+                               monitor,
+                               config.LINEAR_SCALING or None)
+    testing = array_evaluator(test_set, terminal_set,
+                              scaling=training if config.LINEAR_SCALING
+                              else None)
+
+    optimizer = None
+    if config.CONSTANT_ELITES:
+        optimizer = epro.gp.optimize.ConstantOptimizer(
+            config.CONSTANT_ELITES, config.CONSTANT_CANDIDATES,
+            config.CONSTANT_ITERATIONS)
+
+    evaluator = epro.gp.core.GPEvaluator(
+        fitness_function, training, testing,
+        cache, config.WORKERS, racing=config.RACING,
+        batch_func=population_fitness_function, monitor=monitor,
+        parsimony=config.PARSIMONY)
+
+    generation = 0
+    archive = epro.gp.archive.ParetoArchive(config.ARCHIVE_SIZE)
+
+    if checkpoint is not None and os.path.exists(checkpoint):
+        if verbose:
+            print "Resuming from " + checkpoint
+        generation, archive = epro.gp.checkpoint.load(
+            checkpoint, populations[0], evaluator)
+
+    if verbose:
+        print "Evolving.............................."
+    if config.ISLANDS > 1:
+        best = epro.gp.island.islandEvolution(
+            populations, genetic_operator_set, evaluator,
+            config.GENERATIONS, config.MIGRATION_INTERVAL,
+            config.MIGRATION_SIZE, config.TOPOLOGY, verbose=verbose,
+            archive=archive)
+    elif config.STEADY_STATE and config.ASYNCHRONOUS:
+        best = epro.gp.core.asynchronousEvolution(
+            populations[0], genetic_operator_set, evaluator,
+            config.GENERATIONS * config.POPULATION_SIZE,
+            config.STEADY_STATE_BATCH, config.REPLACEMENT,
+            verbose=verbose)
+    elif config.STEADY_STATE:
+        best = epro.gp.core.steadyStateEvolution(
+            populations[0], genetic_operator_set, evaluator,
+            config.GENERATIONS * config.POPULATION_SIZE,
+            config.STEADY_STATE_BATCH, config.REPLACEMENT,
+            verbose=verbose)
+    else:
+        best = epro.gp.core.evolution(populations[0], genetic_operator_set,
+                                      evaluator, config.GENERATIONS,
+                                      checkpoint=checkpoint,
+                                      checkpoint_interval=
+                                      config.CHECKPOINT_INTERVAL,
+                                      start=generation,
+                                      archive=archive,
+                                      optimizer=optimizer,
+                                      verbose=verbose)
+    evaluator.close()
+    evaluator.monitor.close()
+
+    archive.add(best)
+
+    if config.LINEAR_SCALING:
+        function = training.scaledTree(best)
+    else:
+        function = best
+
+    return {'training_error': evaluator.evaluate(best) /
+            len(training_set.data),
+            'testing_error': evaluator.testingError(best) /
+            len(test_set.data),
+            'function': str(function),
+            'front': [(error / len(training_set.data), size)
+                      for error, size, individual in archive.front()],
+            'fitness_hit_rate': evaluator.cache.hitRate(),
+            'output_hit_rate': outputs.hitRate()}
+
+if __name__ == '__main__':
+    if(len(sys.argv) not in (4, 5)):
+        usage()
+        sys.exit(1)
+
+    # Checkpoints are saved to this file, and the run is resumed from
+    # it if it already exists
+    checkpoint = sys.argv[4] if len(sys.argv) == 5 else None
 
-    print "Evolving.............................."
-    best = epro.gp.core.evolution(population, genetic_operator_set,
-                                  evaluator, settings.GENERATIONS)
+    training_set = epro.gp.util.ColumnDataSet(sys.argv[1])
+    test_set = epro.gp.util.ColumnDataSet(sys.argv[2])
 
-    tr_size = len(training_set.data)
-    te_size = len(test_set.data)
+    result = run(training_set, test_set, int(sys.argv[3]), checkpoint)
 
     print "+++Best individual+++"
-    print "\tTraining error: " + str(evaluator.evaluate(best) / tr_size)
-    print "\tTesting error: " + str(evaluator.testingError(best) / te_size)
-    print "\tLearnt function: " + str(best)
+    print "\tTraining error: " + str(result['training_error'])
+    print "\tTesting error: " + str(result['testing_error'])
+    print "\tLearnt function: " + result['function']
+    print "\tPareto front (nodes: training error): " + \
+        ", ".join(["%d: %g" % (size, error)
+                   for error, size in result['front']])
+    print "\tFitness cache hit rate: " + str(result['fitness_hit_rate'])
+    print "\tOutput cache hit rate: " + str(result['output_hit_rate'])
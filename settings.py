@@ -28,6 +28,57 @@ GENERATIONS=30
 P_RAND=0.05
 INITIAL_DEPTH=2
 MAX_HEIGHT=8
+FITNESS_CACHE_SIZE=100000
+OUTPUT_CACHE_BYTES=64 * 2 ** 20
+WORKERS=1
+# Racing abandons the evaluation of an individual once its error
+# exceeds that of the RACING quantile of the previous generation. It
+# can only do so between chunks of CHUNK_SIZE records, so if
+# CHUNK_SIZE is None racing runs use RACING_CHUNKS chunks instead of
+# a single one. Subtree outputs are only cached with a single chunk
+RACING=None
+CHUNK_SIZE=None
+RACING_CHUNKS=8
+ISLANDS=1
+MIGRATION_INTERVAL=10
+MIGRATION_SIZE=5
+TOPOLOGY='ring'
+# Generational runs with a single island given a checkpoint file save
+# it every CHECKPOINT_INTERVAL generations
+CHECKPOINT_INTERVAL=10
+# File to append the JSON metrics of each generation to. Only runs
+# with a single island are instrumented
+METRICS=None
+# Steady-state evolution breeds STEADY_STATE_BATCH offspring at a
+# time, and replaces the worst individuals ('worst') or the losers of
+# replacement tournaments ('tournament')
+STEADY_STATE=False
+STEADY_STATE_BATCH=1
+REPLACEMENT='worst'
+# With more than one worker, steady-state evolution can evaluate
+# batches asynchronously, breeding while they are evaluated
+ASYNCHRONOUS=False
+# Size control. Offspring with more than MAX_SIZE nodes are rejected.
+# NODE_BUDGET is a soft limit on the nodes of each generation:
+# offspring that would exceed it are bred again a few times, and then
+# the smallest one is kept even if it is over. PARSIMONY is added to
+# the training error of each individual for each of its nodes when
+# ranking
+MAX_SIZE=None
+NODE_BUDGET=None
+PARSIMONY=None
+# Trees are fitted with their optimal linear scaling if
+# LINEAR_SCALING is true. If CONSTANT_ELITES is not zero, the
+# constants of that many of the best individuals are optimized every
+# generation, with CONSTANT_CANDIDATES candidates each for
+# CONSTANT_ITERATIONS iterations
+LINEAR_SCALING=False
+CONSTANT_ELITES=0
+CONSTANT_CANDIDATES=10
+CONSTANT_ITERATIONS=5
+# Largest number of individuals in the Pareto front of training
+# error and size kept during a run
+ARCHIVE_SIZE=50
 
 """#Data set 2. Seed 2010
 POPULATION_SIZE=50
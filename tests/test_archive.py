@@ -0,0 +1,139 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+import random
+import unittest
+
+from epro.gp.archive import ParetoArchive
+from epro.gp.core import FitnessBound
+
+"""
+Stands for an individual of the given size and fitness
+"""
+class Individual:
+    def __init__(self, size, fitness):
+        self.size = size
+        self.fitness = fitness
+
+    def __len__(self):
+        return self.size
+
+# Entries of individuals no other one is as accurate and as small as
+# while being better in one of them
+def bruteForceFront(individuals):
+    front = set()
+
+    for x in individuals:
+        if not any([len(y) <= len(x) and y.fitness <= x.fitness and
+                    (len(y) < len(x) or y.fitness < x.fitness)
+                    for y in individuals]):
+            front.add((x.fitness, len(x)))
+
+    return sorted(front, key = lambda entry: entry[1])
+
+# Random individuals. Errors tend to decrease with size, so fronts are
+# long, and some fitness values are not exact finite errors
+def randomStream(state, count):
+    individuals = []
+
+    for i in range(count):
+        size = state.randint(1, 60)
+        if i % 11 == 0:
+            fitness = state.choice([None, float('inf'), float('nan'),
+                                    FitnessBound(1.0)])
+        else:
+            fitness = float(state.randint(0, 40) + 100 - size)
+        individuals.append(Individual(size, fitness))
+
+    return individuals
+
+# Individuals with an exact finite error, the only ones archived
+def exact(individuals):
+    return [individual for individual in individuals
+            if individual.fitness is not None and
+            not isinstance(individual.fitness, FitnessBound) and
+            individual.fitness == individual.fitness and
+            individual.fitness != float('inf')]
+
+"""
+Checks the archive against the brute force front of random streams,
+and that bounded archives keep the smallest and the most accurate
+individuals
+"""
+class ParetoArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.state = random.Random(2010)
+
+    def assertOrdered(self, archive):
+        entries = archive.front()
+        for (error, size, x), (other, larger, y) in zip(entries,
+                                                        entries[1:]):
+            self.assertTrue(size < larger and error > other)
+
+    def testFront(self):
+        for stream in range(20):
+            individuals = randomStream(self.state, 300)
+            archive = ParetoArchive(len(individuals))
+            archive.addAll(individuals)
+
+            self.assertOrdered(archive)
+            self.assertEqual(bruteForceFront(exact(individuals)),
+                             [(error, size) for error, size, individual
+                              in archive.front()])
+
+    def testCapacity(self):
+        for capacity in [2, 3, 5, 10]:
+            individuals = randomStream(self.state, 500)
+            archive = ParetoArchive(capacity)
+
+            for individual in individuals:
+                archive.add(individual)
+                self.assertTrue(len(archive) <= capacity)
+                self.assertOrdered(archive)
+
+            valid = exact(individuals)
+            smallest = min([len(individual) for individual in valid])
+            self.assertEqual(len(archive), capacity)
+            self.assertEqual(archive.sizes[0], smallest)
+            self.assertEqual(archive.errors[0],
+                             min([individual.fitness for individual in valid
+                                  if len(individual) == smallest]))
+            self.assertEqual(archive.best().fitness,
+                             min([individual.fitness
+                                  for individual in valid]))
+
+    def testIgnored(self):
+        archive = ParetoArchive()
+        self.assertTrue(archive.best() is None)
+
+        for fitness in [None, float('inf'), float('nan'), FitnessBound(1.0)]:
+            self.assertFalse(archive.add(Individual(1, fitness)))
+        self.assertEqual(len(archive), 0)
+
+        individual = Individual(3, 2.0)
+        self.assertTrue(archive.add(individual))
+        self.assertFalse(archive.add(individual))
+        self.assertFalse(archive.add(Individual(4, 2.0)))
+        self.assertTrue(archive.add(Individual(3, 1.0)))
+        self.assertEqual(archive.front(), [(1.0, 3, archive.best())])
+
+if __name__ == '__main__':
+    unittest.main()
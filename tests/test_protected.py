@@ -0,0 +1,130 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+import itertools
+import random
+import struct
+import unittest
+
+import numpy
+
+from epro.gp.protected import GPFunction, ArrayGPFunction
+
+# Values where the protected functions and numpy are most likely to
+# disagree: signed zeros, infinities, NaN, overflows, underflows and
+# the domain limits of each function
+SPECIAL = [0.0, -0.0, 1.0, -1.0, 0.5, -0.5, 2.0, -2.0, 3.0, -3.0,
+           1e-300, -1e-300, 1e300, -1e300, 710.0, -710.0, 1e308,
+           1.7976931348623157e308, 5e-324, 1.0 / 3.0,
+           float('inf'), float('-inf'), float('nan')]
+
+UNARY = ['sqrt', 'log', 'log10', 'exp', 'sin', 'cos', 'tan', 'abs']
+BINARY = ['add', 'sub', 'mul', 'div', 'pow', 'min', 'max']
+
+# Bit pattern of a float, so that signed zeros compare exactly. NaN
+# has a single pattern, since numpy and Python disagree on its sign
+# and payload, and nothing in a tree can tell them apart
+def bits(value):
+    if value != value:
+        return 'nan'
+    return struct.pack('<d', value)
+
+"""
+Checks that every array function gives, bit for bit, what its scalar
+version gives for each element, where any NaN matches any NaN. Outputs
+are checked with a separate output buffer, with the output aliasing
+the first argument, and with scalar arguments broadcast against arrays
+"""
+class ArrayConformanceTest(unittest.TestCase):
+    def setUp(self):
+        state = random.Random(2010)
+        self.values = SPECIAL + \
+            [state.uniform(-10, 10) for i in range(40)] + \
+            [state.choice([-1, 1]) * 10 ** state.uniform(-300, 300)
+             for i in range(40)]
+        self.errstate = numpy.seterr(all='ignore')
+
+    def tearDown(self):
+        numpy.seterr(**self.errstate)
+
+    def assertConforms(self, name, arguments, expected, actual):
+        for argument, value, result in zip(arguments, expected, actual):
+            self.assertEqual(bits(value), bits(result),
+                             '%s%r: %r != %r' % (name, argument, value,
+                                                 result))
+
+    def testUnary(self):
+        for name in UNARY:
+            scalar = getattr(GPFunction, name)
+            function = getattr(ArrayGPFunction, name)
+            arguments = [(x,) for x in self.values]
+            expected = [scalar(x) for x in self.values]
+
+            x = numpy.array(self.values)
+            out = numpy.empty(len(x))
+            function(x, out)
+            self.assertConforms(name, arguments, expected, out)
+
+            # Output aliasing the argument
+            function(x, x)
+            self.assertConforms(name, arguments, expected, x)
+
+    def testBinary(self):
+        pairs = list(itertools.product(self.values, self.values))
+
+        for name in BINARY:
+            scalar = getattr(GPFunction, name)
+            function = getattr(ArrayGPFunction, name)
+            expected = [scalar(x, y) for x, y in pairs]
+
+            x = numpy.array([pair[0] for pair in pairs])
+            y = numpy.array([pair[1] for pair in pairs])
+            out = numpy.empty(len(pairs))
+            function(x, y, out)
+            self.assertConforms(name, pairs, expected, out)
+
+            # Output aliasing the first argument
+            function(x, y, x)
+            self.assertConforms(name, pairs, expected, x)
+
+    def testBroadcast(self):
+        for name in BINARY:
+            scalar = getattr(GPFunction, name)
+            function = getattr(ArrayGPFunction, name)
+
+            for value in SPECIAL:
+                array = numpy.array(self.values)
+                out = numpy.empty(len(array))
+
+                # Scalar first argument
+                function(value, array, out)
+                self.assertConforms(
+                    name, [(value, y) for y in self.values],
+                    [scalar(value, y) for y in self.values], out)
+
+                # Scalar second argument, output aliasing the first
+                function(array, value, array)
+                self.assertConforms(
+                    name, [(x, value) for x in self.values],
+                    [scalar(x, value) for x in self.values], array)
+
+if __name__ == '__main__':
+    unittest.main()
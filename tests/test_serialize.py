@@ -0,0 +1,110 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+import array
+import random
+import unittest
+
+from epro.gp.core import FitnessBound
+from epro.gp.serialize import decodeTrees, encodeTrees
+from epro.gp.tree import CONSTANT, Tree, TreeInitParameters
+
+INTERNAL_SET = [('add', 2), ('sub', 2), ('mul', 2), ('div', 2),
+                ('pow', 2), ('sqrt', 1), ('abs', 1), ('log', 1),
+                ('max', 2), ('min', 2)]
+
+def makeTree(parameters, opcodes, arities, constants, max_height=30):
+    tree = Tree(parameters, max_height)
+    tree.setNodes(array.array('h', opcodes), array.array('B', arities),
+                  array.array('d', constants))
+
+    return tree
+
+"""
+Checks that trees decode to what was encoded: nodes, constants,
+maximum height and fitness, including bounds and missing fitness
+"""
+class SerializeTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(2010)
+        self.parameters = TreeInitParameters(['x', 'y', 'z'], INTERNAL_SET,
+                                             0.3, (-5.0, 5.0))
+
+    def assertSameTrees(self, trees, decoded):
+        self.assertEqual(len(trees), len(decoded))
+
+        for tree, other in zip(trees, decoded):
+            self.assertEqual(list(tree.opcodes), list(other.opcodes))
+            self.assertEqual(list(tree.arities), list(other.arities))
+            self.assertEqual(list(tree.constants), list(other.constants))
+            self.assertEqual(tree.max_height, other.max_height)
+            self.assertEqual(tree.fitness, other.fitness)
+            self.assertEqual(type(tree.fitness), type(other.fitness))
+            self.assertEqual(tree.canonicalHash(), other.canonicalHash())
+
+    def roundTrip(self, trees):
+        encoded = encodeTrees(trees, self.parameters)
+        self.assertSameTrees(trees, decodeTrees(encoded, self.parameters))
+
+    def testEmpty(self):
+        self.roundTrip([])
+
+    def testTerminal(self):
+        tree = makeTree(self.parameters, [1], [0], [0.0])
+        tree.fitness = 2.5
+        self.roundTrip([tree])
+
+    def testConstants(self):
+        # add(-0.0, mul(x, 1e308))
+        opcodes = [3, CONSTANT, 5, 0, CONSTANT]
+        tree = makeTree(self.parameters, opcodes, [2, 0, 2, 0, 0],
+                        [0.0, -0.0, 0.0, 0.0, 1e308], 4)
+        constant = makeTree(self.parameters, [CONSTANT], [0], [0.125])
+        self.roundTrip([tree, constant])
+
+        decoded = decodeTrees(encodeTrees([tree], self.parameters),
+                              self.parameters)[0]
+        self.assertEqual(str(tree), str(decoded))
+
+    def testFitness(self):
+        trees = [Tree(self.parameters, random.randint(2, 8), 4, 0.5)
+                 for i in range(50)]
+        for i, tree in enumerate(trees):
+            if i % 4 == 0:
+                tree.fitness = FitnessBound(i * 1.5)
+            elif i % 4 == 1:
+                tree.fitness = float(i) / 7
+            elif i % 4 == 2:
+                tree.fitness = float('inf')
+
+        self.roundTrip(trees)
+        self.assertTrue(any([tree.fitness is None for tree in trees]))
+
+    def testSymbols(self):
+        encoded = encodeTrees([Tree(self.parameters, 8, 3, 0.5)],
+                              self.parameters)
+        others = TreeInitParameters(['x', 'y'], INTERNAL_SET)
+        self.assertRaises(ValueError, decodeTrees, encoded, others)
+        self.assertRaises(ValueError, decodeTrees,
+                          'NOTTREES' + encoded[8:], self.parameters)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+#========================================================================
+#
+# Copyright (C) 2010. Mario Rincon-Nigro.
+#
+# This file is a part of E-Pro.
+#
+# E-Pro is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Flowie is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with E-Pro.  If not, see <http://www.gnu.org/licenses/>.
+#
+#========================================================================
+
+import array
+import random
+import struct
+import unittest
+
+import numpy
+
+from epro.gp.evaluation import ArrayEvaluator
+from epro.gp.simplify import simplify
+from epro.gp.tree import CONSTANT, Tree, TreeInitParameters
+
+INTERNAL_SET = [('add', 2), ('sub', 2), ('mul', 2), ('div', 2),
+                ('pow', 2), ('sqrt', 1), ('abs', 1), ('log', 1),
+                ('log10', 1), ('exp', 1), ('sin', 1), ('cos', 1),
+                ('tan', 1), ('max', 2), ('min', 2)]
+
+# Constants the identities are about are drawn most often
+CONSTANTS = [0.0, 0.0, -0.0, -0.0, 1.0, 1.0, 1.0, 2.0, 2.0,
+             -1.0, 0.5, 3.0, 1e308]
+
+# Columns x and z take special values, y is finite in every record
+X = [0.0, -0.0, 1.0, -1.0, 2.0, -2.0, 0.5, -0.5, 1e-300, 1e300, -1e300,
+     float('inf'), float('-inf'), float('nan')]
+Y = [0.0, -0.0, 1.0, -1.0, 2.0, -2.0, 0.5, -0.5, 3.0, 1e-300, 1e300,
+     -1e300, 7.0, -7.0]
+Z = [float('nan'), float('inf'), 0.0, -0.0, -1.0, 1.0, float('-inf'),
+     2.0, -3.0, 0.25, 1e300, -0.0, 10.0, 0.0]
+
+TREES = 2000
+
+# Bit patterns of the outputs, so that signed zeros compare exactly.
+# NaN has a single pattern, simplification never tells NaN apart.
+# Trees of constants give a single value, which is broadcast
+def bits(output):
+    values = numpy.empty(len(X))
+    values[:] = output
+    return [struct.pack('<d', value) if value == value else 'nan'
+            for value in values]
+
+# Appends to nodes the (opcode, arity, constant) triples of a random
+# subtree in pre-order. Arguments are often repeated, so that the
+# identities of equal arguments apply
+def randomNodes(state, parameters, height, nodes):
+    if height == 0 or state.random() < 0.25:
+        if state.random() < 0.4:
+            nodes.append((CONSTANT, 0, state.choice(CONSTANTS)))
+        else:
+            nodes.append((state.choice(parameters.terminal_codes), 0, 0.0))
+        return
+
+    opcode = state.choice(parameters.internal_codes)
+    arity = parameters.symbols[opcode][1]
+    nodes.append((opcode, arity, 0.0))
+
+    start = len(nodes)
+    randomNodes(state, parameters, height - 1, nodes)
+    end = len(nodes)
+
+    for i in range(1, arity):
+        if state.random() < 0.3:
+            nodes.extend(nodes[start:end])
+        else:
+            randomNodes(state, parameters, height - 1, nodes)
+
+def makeTree(parameters, nodes):
+    opcodes, arities, constants = zip(*nodes)
+    tree = Tree(parameters)
+    tree.setNodes(array.array('h', opcodes), array.array('B', arities),
+                  array.array('d', constants))
+
+    return tree
+
+"""
+Checks that simplified trees compute exactly the outputs of the
+original ones on special values, and that identities that only hold
+for finite values are applied to finite variables only
+"""
+class SimplifyTest(unittest.TestCase):
+    def setUp(self):
+        self.parameters = TreeInitParameters(['x', 'y', 'z'], INTERNAL_SET)
+        variables = {'x': numpy.array(X), 'y': numpy.array(Y),
+                     'z': numpy.array(Z)}
+        target = numpy.zeros(len(X))
+        self.simplified = ArrayEvaluator(variables, target)
+        self.original = ArrayEvaluator(variables, target, simplify=False)
+
+    def tree(self, text):
+        codes = dict((symbol[0], opcode) for opcode, symbol
+                     in enumerate(self.parameters.symbols))
+        name, arguments = text.rstrip(')').split('(')
+        return makeTree(self.parameters,
+                        [(codes[name], 2, 0.0)] +
+                        [(codes[argument], 0, 0.0)
+                         for argument in arguments.split(',')])
+
+    def testFinite(self):
+        self.assertEqual(self.simplified.finite, frozenset(['y']))
+
+    def testOutputs(self):
+        state = random.Random(2010)
+        simplified = 0
+
+        for i in range(TREES):
+            nodes = []
+            randomNodes(state, self.parameters, state.randint(1, 5), nodes)
+            tree = makeTree(self.parameters, nodes)
+
+            if simplify(tree, self.simplified.finite) is not tree:
+                simplified += 1
+
+            expected = bits(self.original.evaluate(tree))
+            self.assertEqual(expected, bits(self.simplified.evaluate(tree)),
+                             str(tree))
+
+        # Many of the trees exercise some rule
+        self.assertTrue(simplified > TREES / 4)
+
+    def testIdentities(self):
+        finite = self.simplified.finite
+
+        for name, value in [('sub', 0.0), ('div', 1.0)]:
+            tree = simplify(self.tree('%s(y,y)' % name), finite)
+            self.assertEqual(list(tree.opcodes), [CONSTANT])
+            self.assertEqual(tree.constants[0], value)
+
+            for variable in ['x', 'z']:
+                tree = self.tree('%s(%s,%s)' % (name, variable, variable))
+                self.assertTrue(simplify(tree, finite) is tree)
+
+            # Without knowing that y is finite nothing is folded
+            tree = self.tree('%s(y,y)' % name)
+            self.assertTrue(simplify(tree) is tree)
+
+if __name__ == '__main__':
+    unittest.main()